@@ -3,21 +3,47 @@ This module allows you to create anki cards with
 pronunciation, explanation and examples of the use of English words
 
 The module also provides functions for easier interaction with AnkiConnect:
- invoke, get_model, get_note, get_notes
+ AnkiConnectClient, invoke, invoke_many, get_model, update_model, get_note,
+ get_notes, add_notes
 """
+import argparse
+import asyncio
 import functools
 import itertools
 import json
 import logging
 import os
+import string
 import sys
-from multiprocessing.dummy import Pool as ThreadPool
+import time
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+from enum import Enum
 from pathlib import Path
+from threading import Thread
 
 import psutil
 import requests
-
+from requests.adapters import HTTPAdapter
+
+try:
+    import aiohttp
+except ImportError:  # fall back to thread pool
+    aiohttp = None
+
+import cache_store
+import checkpoint
+import media
+import metrics
+import providers
+import scheduler
+import settings
+import templates
 from constants import *
+from providers import LOOKUP_ERRORS, WordNotFoundError
+
+PUNCTUATION = string.punctuation + "«»“”‘’…"  # stripped around words
+synced_models = {}  # model name -> key of template pushed to Anki
 
 
 def request(action, **params):
@@ -25,13 +51,19 @@ def request(action, **params):
     return {"action": action, "params": params, "version": 6}
 
 
-def invoke(action, **params):
-    """Invoke one of available actions with given params
+class AnkiConnectError(requests.exceptions.RequestException):
+    """Some of actions invoked in one multi request failed"""
 
-    https://github.com/FooSoft/anki-connect#supported-actions
-    """
-    request_json = json.dumps(request(action, **params))
-    response = requests.post("http://localhost:8765", request_json, timeout=30).json()
+    def __init__(self, actions, errors, results):
+        super().__init__(
+            "; ".join(f"{actions[i]['action']}: {error}" for i, error in errors.items())
+        )
+        self.errors = errors  # index of action -> error
+        self.results = results
+
+
+def check_response(response):
+    """Return result of AnkiConnect response or raise its error"""
     if len(response) != 2:
         raise requests.exceptions.RequestException(
             "response has an unexpected number of fields"
@@ -49,6 +81,86 @@ def invoke(action, **params):
     return response["result"]
 
 
+class AnkiConnectClient:
+    """Client for AnkiConnect API
+
+    Keeps one session with pooled keep-alive connections and retries
+    with exponential backoff while Anki isn't accepting connections
+    """
+
+    def __init__(
+        self,
+        host=ANKI_CONNECT_HOST,
+        port=ANKI_CONNECT_PORT,
+        timeout=ANKI_CONNECT_TIMEOUT,
+        connect_timeout=ANKI_CONNECT_CONNECT_TIMEOUT,
+        retries=ANKI_CONNECT_RETRIES,
+        backoff=ANKI_CONNECT_BACKOFF,
+    ):
+        self.url = f"http://{host}:{port}"
+        self.timeout = (connect_timeout, timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+
+    def post(self, payload):
+        """Send serialized payload, return decoded response"""
+        for attempt in itertools.count():
+            try:
+                response = self.session.post(self.url, payload, timeout=self.timeout)
+                return response.json()
+            except requests.exceptions.ConnectionError:
+                if attempt >= self.retries:
+                    raise
+                delay = self.backoff * 2**attempt
+                logging.info("AnkiConnect is unavailable, retrying in %.1fs", delay)
+                time.sleep(delay)
+
+    def invoke(self, action, **params):
+        """Invoke one of available actions with given params
+
+        https://github.com/FooSoft/anki-connect#supported-actions
+        """
+        response = self.post(json.dumps(request(action, **params)))
+        return check_response(response)
+
+    def invoke_many(self, actions):
+        """Invoke actions made by request() in one round trip
+
+        Uses multi action, returns list of results in the same order.
+        Raise AnkiConnectError if some of actions failed
+        """
+        actions = list(actions)
+        results, errors = [], {}
+        for i, response in enumerate(self.invoke("multi", actions=actions)):
+            try:
+                results.append(check_response(response))
+            except requests.exceptions.RequestException as error:
+                results.append(None)
+                errors[i] = str(error)
+        if errors:
+            raise AnkiConnectError(actions, errors, results)
+        return results
+
+    def close(self):
+        """Close pooled connections"""
+        self.session.close()
+
+
+client = AnkiConnectClient()
+
+
+def invoke(action, **params):
+    """Invoke action using default AnkiConnect client"""
+    return client.invoke(action, **params)
+
+
+def invoke_many(actions):
+    """Invoke actions in one round trip using default AnkiConnect client"""
+    return client.invoke_many(actions)
+
+
 def open_anki():
     """Open Anki if not opened"""
     if "anki.exe" not in (p.name() for p in psutil.process_iter()):
@@ -58,47 +170,166 @@ def open_anki():
 
 def get_model(model_name, links={}):
     """Create params for createModel action"""
-    folder = "assets/"
-    os.chdir(folder)
-    with open("styling.css", "r", encoding="utf-8") as file:
-        css = file.read()
-    with open("back.html", "r", encoding="utf-8") as file:
-        back_html = file.read()
-    with open("front.html", "r", encoding="utf-8") as file:
-        front_html = file.read()
-    os.chdir("..")
-    back_html += "<p>"
-    dicts = DICTIONARIES
-    dicts |= links
-    for key, value in dicts.items():
-        if value:
-            match key:
-                case "Oxford":
-                    back_html += '<a href="https://www.oxfordlearnersdictionaries.com/definition/english/{{Word}}"><img src="https://fontslogo.com/wp-content/uploads/2017/10/Oxford-Dictionaries-Logo-Font.jpg"></a>\n'
-                case "Cambridge":
-                    back_html += '<a href="https://dictionary.cambridge.org/dictionary/english/{{Word}}/"><img src="https://w7.pngwing.com/pngs/647/218/png-transparent-coat-of-arms-of-the-university-of-cambridge-university-of-oxford-ulverston-victoria-high-school-others-text-logo-symmetry.png"></a>\n'
-                case "Macmillan":
-                    back_html += '<a href="https://www.macmillandictionary.com/dictionary/british/{{Word}}"><img src="https://pbs.twimg.com/profile_images/1225002102608494592/GRFg82nJ_400x400.jpg"></a>\n'
-                case "Urban Dictionary":
-                    back_html += '<a href="https://www.urbandictionary.com/define.php?term={{Word}}"><img src="https://play-lh.googleusercontent.com/unQjigibyJQvru9rcCOX7UCqyByuf5-h_tLpA-9fYH93uqrRAnZ0J2IummiejMMhi5Ch"></a>\n'
-                case "Cambridge (ru)":
-                    back_html += 'ru:<a href="https://dictionary.cambridge.org/dictionary/english-russian/{{Word}}/"><img src="https://w7.pngwing.com/pngs/647/218/png-transparent-coat-of-arms-of-the-university-of-cambridge-university-of-oxford-ulverston-victoria-high-school-others-text-logo-symmetry.png"></a></p>\n'
-    back_html += "</p>"
-    return {
-        "modelName": model_name,
-        "inOrderFields": ["Word", "Sound", "Meaning", "IPA"],
-        "isCloze": False,
-        "css": css,
-        "cardTemplates": [{"Name": model_name, "Front": front_html, "Back": back_html}],
-    }
+    return templates.model_params(model_name, templates.compile_template(links))
+
+
+def update_model(model_name, links={}):
+    """Update templates and styling of existing model if they changed
+
+    Takes one round trip if model is up to date, one more to push
+    changed parts. Model isn't checked again while template is the same
+    """
+    template = templates.compile_template(links)
+    if synced_models.get(model_name) == template.key:
+        return
+    live_templates, live_styling = invoke_many(
+        [
+            request("modelTemplates", modelName=model_name),
+            request("modelStyling", modelName=model_name),
+        ]
+    )
+    updates = templates.model_updates(
+        model_name, template, live_templates, live_styling["css"]
+    )
+    if updates:
+        invoke_many([request(action, **params) for action, params in updates])
+        logging.info(
+            "model %s updated: %s", model_name, ", ".join(a for a, _ in updates)
+        )
+    synced_models[model_name] = template.key
 
 
-def parse_json(word):
+def create_model_and_deck(model_name, deck_name, links={}):
+    """Create model and deck if they don't exist, update model otherwise
+
+    Takes one round trip to check model (createDeck doesn't fail on
+    existing deck), one more to create model or check its templates
+    (see update_model)
+    """
+    with metrics.stage("create model"):
+        model_names, _ = invoke_many(
+            [request("modelNames"), request("createDeck", deck=deck_name)]
+        )
+        if model_name not in model_names:
+            invoke("createModel", **get_model(model_name=model_name, links=links))
+            synced_models[model_name] = templates.compile_template(links).key
+        else:
+            update_model(model_name, links)
+
+
+class Status(Enum):
+    """Outcome of word lookup"""
+
+    OK = "ok"
+    NOT_FOUND = "not found"
+    NETWORK_ERROR = "network error"
+    PARSE_ERROR = "parse error"
+    DEFERRED = "deferred"  # not looked up before deadline or cancel
+
+
+@dataclass
+class WordResult:
+    """Result of word lookup, note is set if status is OK"""
+
+    word: str
+    status: Status
+    note: dict = None
+    error: str = None
+
+
+@dataclass
+class Report:
+    """Summary of import"""
+
+    counts: Counter = field(default_factory=Counter)
+    failed: list = field(default_factory=list)
+    total: int = 0  # words to look up
+    fetched: int = 0  # words looked up so far
+    added: int = 0
+    not_added: int = 0
+    elapsed: float = 0.0
+    cancelled: bool = False
+    providers: dict = field(default_factory=dict)  # name -> ProviderStats
+
+    def add(self, result):
+        """Count result of word lookup"""
+        self.counts[result.status] += 1
+        if result.status is not Status.OK:
+            self.failed.append(result.word)
+        if result.status not in (Status.OK, Status.DEFERRED):
+            logging.warning(
+                "%s: %s (%s)", result.word, result.status.value, result.error
+            )
+
+    @property
+    def complete(self):
+        """Check if nothing is left to retry except words not in dictionary"""
+        return len(self.failed) == self.counts[Status.NOT_FOUND]
+
+    def as_dict(self):
+        """Get counts and timing as dict for run report"""
+        return {
+            "elapsed": self.elapsed,
+            "total": self.total,
+            "added": self.added,
+            "not added": self.not_added,
+            "failed": len(self.failed),
+            "cancelled": self.cancelled,
+            "statuses": {s.value: self.counts[s] for s in Status},
+            "providers": {
+                name: asdict(stats) for name, stats in self.providers.items()
+            },
+        }
+
+    def summary(self):
+        """One line summary of import"""
+        summary = f"added: {self.added}, failed: {len(self.failed)}"
+        summary += f" in {self.elapsed:.1f}s"
+        if self.cancelled:
+            summary += ", cancelled"
+        if metrics.recorder.enabled:
+            summary += f"; {metrics.recorder.summary()}"
+        return summary
+
+    def log(self):
+        """Log counts and timing"""
+        counts = ", ".join(f"{s.value}: {self.counts[s]}" for s in Status)
+        logging.info(
+            "done in %.1fs, added: %d, not added: %d, %s",
+            self.elapsed,
+            self.added,
+            self.not_added,
+            counts,
+        )
+        for name, stats in self.providers.items():
+            logging.info(
+                "%s: lookups: %d, hit rate: %.0f%%, not found: %d, errors: %d, "
+                "latency: %.1fms",
+                name,
+                stats.lookups,
+                stats.hit_rate * 100,
+                stats.not_found,
+                stats.errors,
+                stats.latency * 1000,
+            )
+
+
+def lookup_status(error):
+    """Status of lookup that failed with given error"""
+    if isinstance(error, WordNotFoundError):
+        return Status.NOT_FOUND
+    if isinstance(error, (KeyError, IndexError, TypeError, ValueError)):
+        return Status.PARSE_ERROR  # also covers invalid json
+    return Status.NETWORK_ERROR
+
+
+def parse_json(word, api_url=DICTIONARY_API_URL):
     """Parse Json received from Free Dictionary API"""
-    logging.info("parsing: %s", word)
-    word_json = requests.get(
-        f"https://api.dictionaryapi.dev/api/v2/entries/en/{word}", timeout=10
-    ).json()[0]
+    return format_word_json(providers.FreeDictionaryProvider(api_url).lookup(word)[0])
+
+
+def format_word_json(word_json):
+    """Create note fields and audio from Free Dictionary API entry"""
     res = ""
     for elem in word_json["meanings"]:
         part_of_speech = elem["partOfSpeech"]
@@ -138,15 +369,11 @@ def parse_json(word):
     }
 
 
-def get_note(
-    word, cache, deck_name=DECK_NAME, model_name=MODEL_NAME, allow_duplicate=False
+def make_note(
+    word_json, deck_name=DECK_NAME, model_name=MODEL_NAME, allow_duplicate=False
 ):
-    """Create params for addNote action"""
-    if CACHE_ENABLED:
-        if word in cache:
-            return cache[word]
-    word_json = parse_json(word)
-    note = {
+    """Create params for addNote action from parsed word"""
+    return {
         "deckName": deck_name,
         "modelName": model_name,
         "options": {
@@ -155,28 +382,470 @@ def get_note(
         "fields": word_json["fields"],
         "audio": word_json["audio"],
     }
-    if CACHE_ENABLED:
-        cache[word] = note
-    return note
+
+
+def render_note(
+    response, deck_name=DECK_NAME, model_name=MODEL_NAME, allow_duplicate=False
+):
+    """Create params for addNote action from cached API response"""
+    with metrics.stage("render"):
+        if "fields" in response:  # note cached before raw responses were
+            word_json = response
+        else:
+            word_json = format_word_json(response[0])
+    return make_note(word_json, deck_name, model_name, allow_duplicate)
+
+
+def get_note(
+    word,
+    cache=None,
+    deck_name=DECK_NAME,
+    model_name=MODEL_NAME,
+    allow_duplicate=False,
+    api_url=DICTIONARY_API_URL,
+    dictionary=None,
+    deadline=None,
+):
+    """Create params for addNote action
+
+    Word is looked up in `dictionary` (providers.ProviderChain), chain
+    of cache and API is used if it isn't given. Raw response is cached,
+    note is rendered from it for given deck and model, so changing them
+    doesn't need new requests. Requests give up at `deadline` (time.monotonic)
+    """
+    if dictionary is None:
+        dictionary = providers.make_chain(["cache", "api"], cache, api_url)
+    response = dictionary.lookup(word, deadline)
+    return render_note(response, deck_name, model_name, allow_duplicate)
+
+
+async def get_note_async(
+    session,
+    word,
+    cache=None,
+    deck_name=DECK_NAME,
+    model_name=MODEL_NAME,
+    allow_duplicate=False,
+    api_url=DICTIONARY_API_URL,
+    dictionary=None,
+):
+    """Async version of get_note, uses given aiohttp session"""
+    if dictionary is None:
+        dictionary = providers.make_chain(["cache", "api"], cache, api_url)
+    response = await dictionary.lookup_async(session, word)
+    return render_note(response, deck_name, model_name, allow_duplicate)
+
+
+def get_result(word, deadline=None, **kwargs):
+    """Look up word with get_note, return WordResult instead of raising
+
+    Word isn't looked up after `deadline` (time.monotonic), lookup
+    that is still in progress at `deadline` gives up, word gets
+    DEFERRED status then
+    """
+    if deadline is not None and time.monotonic() >= deadline:
+        return WordResult(word, Status.DEFERRED)
+    try:
+        note = get_note(word, deadline=deadline, **kwargs)
+        return WordResult(word, Status.OK, note)
+    except LOOKUP_ERRORS as error:
+        if deadline is not None and time.monotonic() >= deadline:
+            return WordResult(word, Status.DEFERRED, error=repr(error))
+        return WordResult(word, lookup_status(error), error=repr(error))
+
+
+async def get_result_async(session, word, deadline=None, **kwargs):
+    """Async version of get_result
+
+    Lookup that is still pending at `deadline` is cancelled
+    """
+    timeout = None if deadline is None else deadline - time.monotonic()
+    if timeout is not None and timeout <= 0:
+        return WordResult(word, Status.DEFERRED)
+    try:
+        note = await asyncio.wait_for(get_note_async(session, word, **kwargs), timeout)
+        return WordResult(word, Status.OK, note)
+    except LOOKUP_ERRORS as error:
+        if deadline is not None and time.monotonic() >= deadline:
+            return WordResult(word, Status.DEFERRED, error=repr(error))
+        return WordResult(word, lookup_status(error), error=repr(error))
+
+
+def dictionary_session(concurrency=CONCURRENCY):
+    """Create aiohttp session with keep-alive connection pool for lookups"""
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=10)
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
 
 
 def threading(func):
-    """Decorator for threading"""
+    """Decorator for threading
+
+    Decorated function takes iterable instead of one item and applies
+    func to each item in `concurrency` threads (see scheduler.imap),
+    returns list of results in order of items
+    """
 
     @functools.wraps(func)
-    def wrapper(iterable, **kwargs):
+    def wrapper(iterable, concurrency=CONCURRENCY, **kwargs):
         map_func = functools.partial(func, **kwargs)
-        with ThreadPool() as pool:
-            results = pool.map(map_func, split_iterable(iterable))
-        return list(itertools.chain.from_iterable(results))
+        return list(scheduler.imap(map_func, iterable, concurrency))
 
     return wrapper
 
 
 @threading
-def get_notes(words, **kargs):
-    """Create params for addNotes action"""
-    return [get_note(word, **kargs) for word in words]
+def get_notes_threaded(word, **kwargs):
+    """Get WordResult for each word using thread pool"""
+    return get_result(word, **kwargs)
+
+
+async def get_notes_async(words, concurrency=CONCURRENCY, **kwargs):
+    """Get WordResult for each word using asyncio
+
+    At most `concurrency` requests are in flight at once,
+    all of them share one keep-alive connection pool
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def get_result_limited(session, word):
+        async with semaphore:
+            return await get_result_async(session, word, **kwargs)
+
+    async with dictionary_session(concurrency) as session:
+        return await asyncio.gather(*(get_result_limited(session, w) for w in words))
+
+
+def get_notes(words, **kwargs):
+    """Get WordResult for each word, in order of words
+
+    Failed lookups don't stop the others, they get corresponding status.
+
+    Uses asyncio engine if aiohttp is installed and ASYNC_ENABLED is set,
+    thread pool otherwise
+    """
+    if kwargs.get("dictionary") is None:
+        with open_dictionary(
+            kwargs.get("cache"),
+            kwargs.get("api_url", DICTIONARY_API_URL),
+            concurrency=kwargs.get("concurrency", CONCURRENCY),
+        ) as dictionary:
+            return get_notes(words, **kwargs | {"dictionary": dictionary})
+    if aiohttp is not None and ASYNC_ENABLED:
+        return asyncio.run(get_notes_async(words, **kwargs))
+    return get_notes_threaded(words, **kwargs)
+
+
+async def iter_results_async(words, concurrency=CONCURRENCY, **kwargs):
+    """Yield WordResult as soon as each word is looked up
+
+    `concurrency` workers take words one by one from shared iterator,
+    created notes wait in bounded queue until they are consumed
+    """
+    words = iter(words)
+    queue = asyncio.Queue(maxsize=concurrency)
+    finished = object()
+
+    async def worker(session):
+        try:
+            for word in words:
+                await queue.put(await get_result_async(session, word, **kwargs))
+        except Exception as error:  # reraised by consumer
+            await queue.put(error)
+        await queue.put(finished)
+
+    async with dictionary_session(concurrency) as session:
+        workers = [asyncio.create_task(worker(session)) for _ in range(concurrency)]
+        try:
+            running = len(workers)
+            while running:
+                item = await queue.get()
+                if item is finished:
+                    running -= 1
+                elif isinstance(item, Exception):
+                    raise item
+                else:
+                    yield item
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+
+def iterate_in_background(async_iterable):
+    """Yield items of async iterable running in event loop of separate thread
+
+    Tasks of async iterable keep running while yielded item is processed
+    """
+
+    async def next_item(iterator):
+        return await anext(iterator)
+
+    loop = asyncio.new_event_loop()
+    thread = Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    iterator = aiter(async_iterable)
+    try:
+        while True:
+            future = asyncio.run_coroutine_threadsafe(next_item(iterator), loop)
+            try:
+                yield future.result()
+            except StopAsyncIteration:
+                return
+    finally:
+        asyncio.run_coroutine_threadsafe(iterator.aclose(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+
+def iter_results(words, **kwargs):
+    """Yield WordResult as soon as each word is looked up
+
+    Results are yielded in order of completion, not in order of words
+    """
+    if aiohttp is not None and ASYNC_ENABLED:
+        yield from iterate_in_background(iter_results_async(words, **kwargs))
+        return
+    concurrency = kwargs.pop("concurrency", CONCURRENCY)
+    yield from scheduler.imap(
+        functools.partial(get_result, **kwargs), words, concurrency, ordered=False
+    )
+
+
+def normalize_word(word, lemmatize=None):
+    """Trim whitespace and punctuation around word, case-fold it
+
+    `lemmatize` is optional function that returns base form of word
+    """
+    word = " ".join(word.split()).strip(PUNCTUATION).strip().casefold()
+    if word and lemmatize is not None:
+        word = lemmatize(word)
+    return word
+
+
+def normalize_words(words, lemmatize=None):
+    """Normalize words, drop blank ones and duplicates keeping order"""
+    return list(
+        dict.fromkeys(
+            word for word in (normalize_word(word, lemmatize) for word in words) if word
+        )
+    )
+
+
+def prepare_words(words, cache, lemmatize=None):
+    """Normalize words before looking them up, cached words go first
+
+    Log how many lookups are saved by dropping blank words and duplicates
+    """
+    words = list(words)
+    unique = normalize_words(words, lemmatize)
+    cached, uncached = [], []
+    for word in unique:
+        (cached if word in cache else uncached).append(word)
+    logging.info(
+        "words: %d, unique: %d, cached: %d, lookups saved: %d",
+        len(words),
+        len(unique),
+        len(cached),
+        len(words) - len(uncached),
+    )
+    return cached + uncached
+
+
+def existing_words(deck_name=DECK_NAME, model_name=MODEL_NAME):
+    """Get normalized words of notes that already exist in deck
+
+    Takes two requests for the whole deck instead of one per word
+    """
+    deck_name, model_name = (s.replace('"', '\\"') for s in (deck_name, model_name))
+    note_ids = invoke("findNotes", query=f'"deck:{deck_name}" "note:{model_name}"')
+    if not note_ids:
+        return set()
+    notes = invoke("notesInfo", notes=note_ids)
+    return {normalize_word(note["fields"]["Word"]["value"]) for note in notes}
+
+
+def skip_existing(words, deck_name=DECK_NAME, model_name=MODEL_NAME):
+    """Drop words that already have notes in deck"""
+    try:
+        existing = existing_words(deck_name, model_name)
+    except requests.exceptions.RequestException as error:
+        logging.warning("failed to check existing notes: %s", error)
+        return words
+    new_words = [word for word in words if word not in existing]
+    logging.info(
+        "words to add: %d, already in deck: %d",
+        len(new_words),
+        len(words) - len(new_words),
+    )
+    return new_words
+
+
+def submit_chunk(chunk, report, media_store=None):
+    """Send notes of successful results to Anki with one addNotes action
+
+    Return words which notes were added
+    """
+    for result in chunk:
+        report.add(result)
+    words = [result.word for result in chunk if result.status is Status.OK]
+    notes = [result.note for result in chunk if result.status is Status.OK]
+    if not notes:
+        return []
+    if media_store is not None:
+        with metrics.stage("media"):
+            notes = media_store.attach(notes, client)
+    try:
+        with metrics.stage("add notes"):
+            note_ids = invoke("addNotes", notes=notes)
+    except requests.exceptions.RequestException as error:
+        logging.error("failed to add %d notes: %s", len(notes), error)
+        report.not_added += len(notes)
+        report.failed += words
+        return []
+    report.added += sum(bool(note_id) for note_id in note_ids)
+    logging.info("added notes: %d", report.added)
+    return [word for word, note_id in zip(words, note_ids) if note_id]
+
+
+def chunk_states(chunk, submitted):
+    """Get (word, state) pairs of chunk for checkpoint journal"""
+    submitted = set(submitted)
+    for result in chunk:
+        if result.word in submitted:
+            yield result.word, checkpoint.SUBMITTED
+        elif result.status is Status.OK:
+            yield result.word, checkpoint.RENDERED
+        elif result.status is Status.NOT_FOUND:
+            yield result.word, checkpoint.NOT_FOUND
+        elif result.status is Status.PARSE_ERROR:
+            yield result.word, checkpoint.FETCHED
+
+
+def skip_completed(words, journal, deck_name=DECK_NAME):
+    """Drop words that have nothing left to do according to journal"""
+    completed = journal.completed(deck_name)
+    new_words = [word for word in words if word not in completed]
+    logging.info(
+        "words to resume: %d, done before: %d",
+        len(new_words),
+        len(words) - len(new_words),
+    )
+    return new_words
+
+
+def add_notes(
+    words,
+    chunk_size=CHUNK_SIZE,
+    failed_path=FAILED_WORDS_PATH,
+    lemmatize=None,
+    check_existing=True,
+    download_media=MEDIA_ENABLED,
+    offline=OFFLINE_ENABLED,
+    deadline=IMPORT_DEADLINE,
+    journal=None,
+    resume=False,
+    progress=None,
+    cancel=None,
+    **kwargs,
+):
+    """Add notes to Anki by chunks while words are being parsed
+
+    Words are normalized first (see prepare_words), words that already
+    have notes in deck are skipped if `check_existing` is set.
+    Each chunk is sent with separate addNotes action as soon as it's full,
+    so failed chunk doesn't affect the others. If `download_media` is set,
+    audio is downloaded and uploaded to Anki by media.MediaStore.
+    Words are looked up in DICTIONARY_PROVIDERS (see open_dictionary),
+    if `offline` is set, remote ones aren't used and audio isn't downloaded.
+    Words that weren't added, or weren't looked up in `deadline` seconds
+    (0 - no limit), are written to `failed_path` to retry them later.
+    State of words of each chunk is appended to `journal`
+    (checkpoint.Journal) with cache flushed, if `resume` is set,
+    words done by previous imports are skipped.
+    `progress` is called with Report after each looked up word and each
+    chunk. If `cancel` (threading.Event) is set, import stops after the
+    current chunk, the rest of words are deferred. Return Report
+    """
+    report = Report()
+    started = time.perf_counter()
+    if deadline:
+        kwargs["deadline"] = time.monotonic() + deadline
+    deck_name = kwargs.get("deck_name", DECK_NAME)
+    cache = kwargs.get("cache", {})
+    with metrics.stage("prepare"):
+        words = prepare_words(words, cache, lemmatize)
+        if journal is not None and resume:
+            words = skip_completed(words, journal, deck_name)
+        if check_existing and words:
+            words = skip_existing(
+                words, deck_name, kwargs.get("model_name", MODEL_NAME)
+            )
+    report.total = len(words)
+    dictionary = open_dictionary(
+        kwargs.get("cache"),
+        kwargs.get("api_url", DICTIONARY_API_URL),
+        offline,
+        kwargs.get("concurrency", CONCURRENCY),
+    )
+    kwargs["dictionary"] = dictionary
+    media_store = media.MediaStore() if download_media and not offline else None
+
+    def track(results):
+        for result in results:
+            report.fetched += 1
+            if progress is not None:
+                progress(report)
+            yield result
+
+    lookups = iter_results(words, **kwargs)
+    results = track(lookups)
+    done = set()
+    try:
+        for chunk in split_iterable(results, chunk_size):
+            done.update(result.word for result in chunk)
+            submitted = submit_chunk(chunk, report, media_store)
+            if journal is not None:
+                if isinstance(cache, cache_store.CacheBackend):
+                    cache.flush()  # journal must not get ahead of cache
+                journal.record(deck_name, chunk_states(chunk, submitted))
+                journal.flush()
+            if progress is not None:
+                progress(report)
+            if cancel is not None and cancel.is_set():
+                report.cancelled = True
+                break
+    finally:
+        lookups.close()  # stop lookups left after cancel
+        if media_store is not None:
+            media_store.close()
+        dictionary.close()
+    if report.cancelled:
+        for word in words:
+            if word not in done:
+                report.add(WordResult(word, Status.DEFERRED))
+        logging.info("import cancelled, words left: %d", len(words) - len(done))
+    report.providers = dictionary.stats
+    report.elapsed = time.perf_counter() - started
+    save_failed_words(report.failed, failed_path)
+    report.log()
+    metrics.recorder.results.update(report.as_dict())
+    return report
+
+
+def open_dictionary(
+    cache=None, api_url=DICTIONARY_API_URL, offline=False, concurrency=CONCURRENCY
+):
+    """Create chain of DICTIONARY_PROVIDERS
+
+    Local providers go first, response of the one that has the word
+    is stored in cache. If `offline` is set, network isn't used.
+    `concurrency` is number of lookups that run at once
+    """
+    return providers.make_chain(
+        DICTIONARY_PROVIDERS, cache, api_url, not offline, concurrency
+    )
 
 
 def get_words(filename):
@@ -189,52 +858,92 @@ def get_words(filename):
     return words
 
 
-def load_cache():
-    """Get cache from json file"""
-    Path(CACHED_WORDS_PATH).parent.mkdir(parents=True, exist_ok=True)
-    if os.path.exists(CACHED_WORDS_PATH):
-        if os.path.getsize(CACHED_WORDS_PATH) > 0:
-            with open(CACHED_WORDS_PATH, "r", encoding="utf-8") as file:
-                return json.load(file)
-        return {}
-    open(CACHED_WORDS_PATH, "a", encoding="utf-8").close()
-    return {}
+def load_cache(
+    path=CACHED_WORDS_PATH, backend=CACHE_BACKEND, policy=cache_store.CachePolicy()
+):
+    """Open cache of parsed words, see cache_store"""
+    with metrics.stage("load cache"):
+        return cache_store.open_cache(path, backend, policy)
+
+
+def save_cache(cache):
+    """Write pending changes of cache and close it"""
+    with metrics.stage("save cache"):
+        cache.close()
+
 
+def save_failed_words(words, path=FAILED_WORDS_PATH):
+    """Write words to retry list, one per line"""
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as file:
+        file.writelines(f"{word}\n" for word in words)
+    if words:
+        logging.info("words to retry are saved to %s", path)
 
-def split_iterable(iterable, size=5):
-    """Split iterable into iterables"""
+
+def split_iterable(iterable, size=CHUNK_SIZE):
+    """Split iterable into lists of `size` items, the last one may be shorter"""
     if sys.version_info >= (3, 12):
         for batch in itertools.batched(iterable, size):
             yield batch
     else:
-        for i in range(0, len(iterable), size):
-            yield iterable[i : i + size]
+        iterator = iter(iterable)
+        while batch := list(itertools.islice(iterator, size)):
+            yield batch
 
 
-def main():
+def main(argv=None):
     """Create model and deck, add cards to deck
 
-    Create model with name MODEL_NAME if not exists
-    Create deck with name DECK_NAME if not exists
+    Create model and deck set in config (see settings) if not exist
     Add card to deck for each uncached word from WORDLIST_NAME
+
+    With --resume words done by previous imports are skipped,
+    nothing is done if WORDLIST_NAME hasn't changed since complete import
     """
+    parser = argparse.ArgumentParser(description="Add words from wordlist to Anki")
+    parser.add_argument(
+        "--resume", action="store_true", help="skip words done by previous imports"
+    )
+    args = parser.parse_args(argv)
+
     logging.basicConfig(level=logging.INFO, format="%(levelname)s - %(message)s")
     os.chdir(".")
 
     open_anki()
 
-    if MODEL_NAME not in invoke("modelNames"):
-        invoke("createModel", **get_model(model_name=MODEL_NAME))
-    if DECK_NAME not in invoke("deckNames"):
-        invoke("createDeck", deck=DECK_NAME)
-    cache = load_cache() if CACHE_ENABLED else {}
-
+    config = settings.load()
     words = get_words(WORDLIST_NAME)
-    invoke("addNotes", notes=get_notes(words, cache=cache))
-
-    if CACHE_ENABLED:
-        with open(CACHED_WORDS_PATH, "w", encoding="utf-8") as file:
-            json.dump(cache, file, indent=2)
+    journal = checkpoint.Journal() if JOURNAL_ENABLED else None
+    if args.resume and journal and journal.unchanged(config.deck_name, WORDLIST_NAME):
+        logging.info("%s hasn't changed since last import", WORDLIST_NAME)
+        journal.close()
+        return
+
+    with metrics.run() as recorder:
+        create_model_and_deck(config.model_name, config.deck_name, config.dictionaries)
+        cache = {}
+        if config.cache_enabled:
+            cache = load_cache(config.cache_path, policy=config.cache_policy())
+
+        try:
+            report = add_notes(
+                words,
+                cache=cache,
+                journal=journal,
+                resume=args.resume,
+                deck_name=config.deck_name,
+                model_name=config.model_name,
+            )
+            if journal is not None and report.complete:
+                journal.record_source(config.deck_name, WORDLIST_NAME)
+        finally:  # keep parsed words even if import was interrupted
+            if config.cache_enabled:
+                save_cache(cache)
+            if journal is not None:
+                journal.close()
+    if recorder.enabled:
+        logging.info("stages: %s", recorder.summary())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,442 @@
+"""
+This module runs import end-to-end against local stand-in servers
+
+FakeAnkiConnect answers actions used by the app instead of Anki,
+FakeDictionary answers like Free Dictionary API with configurable
+latency, share of errors and size of entries. Each scenario (app.main,
+app.get_notes, gui.Model._createNotes) runs on synthetic wordlists
+of given sizes in its own temporary folder, and report with throughput,
+p50/p99 latency of word lookups, peak RSS and cache load/save time
+is printed as json:
+ python benchmark.py --sizes 100 10000 100000 --output report.json
+"""
+import argparse
+import contextlib
+import json
+import logging
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from threading import Event, Lock, RLock, Thread
+
+import psutil
+
+import app
+import providers
+import ratelimit
+from constants import *
+
+try:
+    import gui
+except ImportError:  # PyQt6 isn't installed, its scenario is skipped
+    gui = None
+
+SCENARIOS = ["main", "get_notes", "createNotes"]
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Keep-alive handler that doesn't log requests"""
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def send(self, status, body, headers=()):
+        """Send json body, return its size"""
+        body = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for header in headers:
+            self.send_header(*header)
+        self.end_headers()
+        self.wfile.write(body)
+        return len(body)
+
+
+class Server:
+    """Threading HTTP server running in background thread"""
+
+    def __init__(self, handler, port=0):
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_port
+        self.thread = Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FakeAnkiConnect(Server):
+    """Stand-in for AnkiConnect that keeps models, decks and notes in memory"""
+
+    def __init__(self, port=ANKI_CONNECT_PORT):
+        fake = self
+
+        class AnkiHandler(Handler):
+            def do_POST(self):
+                payload = json.loads(
+                    self.rfile.read(int(self.headers["Content-Length"]))
+                )
+                self.send(200, fake.invoke(payload))
+
+        self.lock = RLock()  # multi invokes other actions
+        self.reset()
+        super().__init__(AnkiHandler, port)
+
+    def reset(self):
+        """Forget everything added by previous scenario"""
+        self.models = {}  # name -> createModel params
+        self.decks = {"Default"}
+        self.notes = []
+
+    def invoke(self, payload):
+        action, params = payload["action"], payload.get("params", {})
+        with self.lock:
+            match action:
+                case "multi":
+                    return self._result([self.invoke(a) for a in params["actions"]])
+                case "version":
+                    return self._result(6)
+                case "modelNames":
+                    return self._result(sorted(self.models))
+                case "deckNames":
+                    return self._result(sorted(self.decks))
+                case "createModel":
+                    self.models[params["modelName"]] = params
+                    return self._result({"name": params["modelName"]})
+                case "modelTemplates":
+                    model = self.models[params["modelName"]]
+                    return self._result(
+                        {
+                            card["Name"]: {"Front": card["Front"], "Back": card["Back"]}
+                            for card in model["cardTemplates"]
+                        }
+                    )
+                case "modelStyling":
+                    return self._result(
+                        {"css": self.models[params["modelName"]]["css"]}
+                    )
+                case "updateModelTemplates":
+                    model = self.models[params["model"]["name"]]
+                    for card in model["cardTemplates"]:
+                        card.update(params["model"]["templates"].get(card["Name"], {}))
+                    return self._result(None)
+                case "updateModelStyling":
+                    self.models[params["model"]["name"]]["css"] = params["model"]["css"]
+                    return self._result(None)
+                case "createDeck":
+                    self.decks.add(params["deck"])
+                    return self._result(len(self.decks))
+                case "addNotes":
+                    start = len(self.notes)
+                    self.notes += params["notes"]
+                    ids = range(start + 1, len(self.notes) + 1)  # 0 - not added
+                    return self._result(list(ids))
+                case "findNotes" | "getMediaFilesNames":
+                    return self._result([])
+                case "notesInfo":
+                    return self._result([])
+        return {"result": None, "error": f"unsupported action: {action}"}
+
+    @staticmethod
+    def _result(result):
+        return {"result": result, "error": None}
+
+
+class FakeDictionary(Server):
+    """Stand-in for Free Dictionary API
+
+    Latency of each answer is drawn from lognormal distribution with
+    median `latency`, `error_rate` of requests fail with 500,
+    `not_found_rate` of words aren't found, entries have from one
+    to `max_definitions` definitions
+    """
+
+    def __init__(
+        self,
+        latency=0.005,
+        latency_sigma=0.5,
+        error_rate=0.0,
+        not_found_rate=0.01,
+        max_definitions=10,
+        seed=0,
+    ):
+        fake = self
+
+        class DictionaryHandler(Handler):
+            def do_GET(self):
+                fake.answer(self, self.path.rsplit("/", 1)[-1])
+
+        self.latency = latency
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.not_found_rate = not_found_rate
+        self.max_definitions = max_definitions
+        self.random = random.Random(seed)
+        self.lock = Lock()
+        self.bytes_sent = 0
+        super().__init__(DictionaryHandler)
+        self.url = f"http://127.0.0.1:{self.port}/api/v2/entries/en/"
+
+    def answer(self, handler, word):
+        with self.lock:  # random.Random isn't shared safely otherwise
+            delay = self.latency * math.exp(self.random.gauss(0, self.latency_sigma))
+            failed = self.random.random() < self.error_rate
+            definitions = self.random.randint(1, self.max_definitions)
+        time.sleep(delay)
+        if failed:
+            sent = handler.send(500, {"title": "Internal Server Error"})
+        elif word_hash(word) < self.not_found_rate:
+            sent = handler.send(404, {"title": "No Definitions Found"})
+        else:
+            response = providers.stub_response(word)
+            meaning = response[0]["meanings"][0]
+            meaning["definitions"] *= definitions
+            sent = handler.send(200, response)
+        with self.lock:
+            self.bytes_sent += sent
+
+
+def word_hash(word):
+    """Stable number in [0, 1) for word, so the same words are never found"""
+    return zlib.crc32(word.encode()) / 2**32
+
+
+def synthetic_words(count, seed=0):
+    """Make list of `count` distinct made up words"""
+    rand = random.Random(seed)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    words = set()
+    while len(words) < count:
+        words.add("".join(rand.choices(letters, k=rand.randint(4, 12))))
+    return sorted(words, key=lambda _: rand.random())
+
+
+class Probe:
+    """Measures lookups and cache load/save by wrapping functions of app"""
+
+    def __init__(self):
+        self.latencies = []
+        self.statuses = Counter()
+        self.cache_load = 0.0
+        self.cache_save = 0.0
+        self.originals = {}
+
+    def __enter__(self):
+        for name in ("get_result", "get_result_async", "load_cache", "save_cache"):
+            self.originals[name] = getattr(app, name)
+        originals = self.originals
+
+        def get_result(word, **kwargs):
+            started = time.perf_counter()
+            result = originals["get_result"](word, **kwargs)
+            self._record(started, result)
+            return result
+
+        async def get_result_async(session, word, **kwargs):
+            started = time.perf_counter()
+            result = await originals["get_result_async"](session, word, **kwargs)
+            self._record(started, result)
+            return result
+
+        def load_cache(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return originals["load_cache"](*args, **kwargs)
+            finally:
+                self.cache_load += time.perf_counter() - started
+
+        def save_cache(cache):
+            started = time.perf_counter()
+            try:
+                return originals["save_cache"](cache)
+            finally:
+                self.cache_save += time.perf_counter() - started
+
+        app.get_result = get_result
+        app.get_result_async = get_result_async
+        app.load_cache = load_cache
+        app.save_cache = save_cache
+        return self
+
+    def __exit__(self, *exc_info):
+        for name, func in self.originals.items():
+            setattr(app, name, func)
+
+    def _record(self, started, result):
+        self.latencies.append(time.perf_counter() - started)
+        self.statuses[result.status.value] += 1
+
+
+class PeakRss:
+    """Samples resident memory of process in background thread"""
+
+    def __init__(self, interval=0.02):
+        self.interval = interval
+        self.process = psutil.Process()
+        self.peak = 0
+        self.stopped = Event()
+
+    def _sample(self):
+        while not self.stopped.is_set():
+            self.peak = max(self.peak, self.process.memory_info().rss)
+            self.stopped.wait(self.interval)
+
+    def __enter__(self):
+        self.thread = Thread(target=self._sample, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+        self.peak = max(self.peak, self.process.memory_info().rss)
+
+
+def percentile(values, share):
+    """Value below which `share` of values are"""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+def milliseconds(seconds):
+    return None if seconds is None else round(seconds * 1000, 2)
+
+
+@contextlib.contextmanager
+def workdir(assets):
+    """Run in temporary folder with copy of assets, like app folder"""
+    previous = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="lazy_english_") as folder:
+        shutil.copytree(assets, Path(folder) / "assets")
+        os.chdir(folder)
+        try:
+            yield Path(folder)
+        finally:
+            os.chdir(previous)
+
+
+def run_main(words, dictionary):
+    Path(WORDLIST_NAME).write_text("\n".join(words), encoding="utf-8")
+    app.main([])
+
+
+def run_get_notes(words, dictionary):
+    cache = app.load_cache() if CACHE_ENABLED else {}
+    try:
+        app.get_notes(words, cache=cache, api_url=dictionary.url)
+    finally:
+        if CACHE_ENABLED:
+            app.save_cache(cache)
+
+
+def run_create_notes(words, dictionary):
+    model = gui.Model()
+    config = model.configHandler.config
+    app.create_model_and_deck(config.model_name, config.deck_name)
+    model._createNotes(words)
+
+
+RUNNERS = {
+    "main": run_main,
+    "get_notes": run_get_notes,
+    "createNotes": run_create_notes,
+}
+
+
+def run_scenario(name, words, anki, dictionary, assets):
+    """Run scenario on words in fresh folder, return its measurements"""
+    anki.reset()
+    sent = dictionary.bytes_sent
+    with workdir(assets), Probe() as probe, PeakRss() as rss:
+        started = time.perf_counter()
+        RUNNERS[name](words, dictionary)
+        elapsed = time.perf_counter() - started
+    return {
+        "scenario": name,
+        "words": len(words),
+        "seconds": round(elapsed, 3),
+        "throughput": round(len(words) / elapsed, 1),
+        "latency_p50_ms": milliseconds(percentile(probe.latencies, 0.5)),
+        "latency_p99_ms": milliseconds(percentile(probe.latencies, 0.99)),
+        "peak_rss_mb": round(rss.peak / 2**20, 1),
+        "cache_load_s": round(probe.cache_load, 4),
+        "cache_save_s": round(probe.cache_save, 4),
+        "bytes_fetched": dictionary.bytes_sent - sent,
+        "notes_added": len(anki.notes),
+        "statuses": dict(probe.statuses),
+    }
+
+
+def main():
+    """Run scenarios on wordlists of given sizes, print json report"""
+    parser = argparse.ArgumentParser(description="Benchmark import end-to-end")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 10_000, 100_000])
+    parser.add_argument("--scenarios", nargs="+", default=SCENARIOS, choices=SCENARIOS)
+    parser.add_argument("--anki-port", type=int, default=ANKI_CONNECT_PORT)
+    parser.add_argument("--latency", type=float, default=0.005, help="median, seconds")
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--not-found-rate", type=float, default=0.01)
+    parser.add_argument("--max-definitions", type=int, default=10)
+    parser.add_argument(
+        "--rate-limit", type=float, default=0, help="requests/s, 0 - no limit"
+    )
+    parser.add_argument("--output", help="write report to file instead of stdout")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR, format="%(levelname)s - %(message)s")
+    if "createNotes" in args.scenarios and gui is None:
+        logging.error("PyQt6 isn't installed, createNotes scenario is skipped")
+        args.scenarios.remove("createNotes")
+    rate = args.rate_limit or 1e9
+    providers.rate_limiter = ratelimit.RateLimiter(rate, rate, rate)
+    anki = FakeAnkiConnect(args.anki_port)
+    dictionary = FakeDictionary(
+        args.latency,
+        args.latency_sigma,
+        args.error_rate,
+        args.not_found_rate,
+        args.max_definitions,
+    )
+    app.client = app.AnkiConnectClient(host="127.0.0.1", port=anki.port)
+    app.DICTIONARY_API_URL = dictionary.url  # used by main and gui
+    assets = Path(__file__).resolve().parent / "assets"
+    results = []
+    try:
+        for size in args.sizes:
+            words = synthetic_words(size)
+            for name in args.scenarios:
+                results.append(run_scenario(name, words, anki, dictionary, assets))
+                print(json.dumps(results[-1]), file=sys.stderr)  # progress
+    finally:
+        anki.close()
+        dictionary.close()
+    report = {
+        "config": vars(args),
+        "python": sys.version.split()[0],
+        "results": results,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2), encoding="utf-8")
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
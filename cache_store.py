@@ -0,0 +1,403 @@
+"""
+This module provides storages for cache of parsed words:
+ JsonCache keeps the whole cache in one json file,
+ SqliteCache keeps it in indexed SQLite database
+
+Both of them behave like dict, use open_cache to get one.
+Value None means that word wasn't found in dictionary.
+Entries expire according to CachePolicy, least recently used ones
+are evicted on prune when cache exceeds its limits
+
+See stats of cache, prune or clear it with command line interface:
+ python -m lazy_english cache stats|prune|clear
+"""
+import json
+import logging
+import os
+import sqlite3
+import time
+from collections.abc import MutableMapping
+from dataclasses import dataclass
+from pathlib import Path
+from threading import Lock, RLock
+
+from constants import *
+
+DAY = 24 * 60 * 60
+MB = 2**20
+
+
+@dataclass(frozen=True)
+class CachePolicy:
+    """Limits of cache, 0 means no limit"""
+
+    max_entries: int = CACHE_MAX_ENTRIES
+    max_size_mb: float = CACHE_MAX_SIZE_MB
+    ttl_days: float = CACHE_TTL_DAYS
+    negative_ttl_days: float = CACHE_NEGATIVE_TTL_DAYS
+
+    def cutoff(self, negative, now):
+        """Entries created before returned time are expired"""
+        ttl = self.negative_ttl_days if negative else self.ttl_days
+        return now - ttl * DAY if ttl else 0
+
+    def expired(self, negative, created, now):
+        """Check if entry created at given time is expired"""
+        return created < self.cutoff(negative, now)
+
+
+class CacheBackend(MutableMapping):
+    """Base class for storages of parsed words
+
+    Changes may be kept in memory until flush is called
+    """
+
+    def __init__(self, policy=CachePolicy()):
+        self.policy = policy
+
+    def flush(self):
+        """Write pending changes"""
+
+    def prune(self):
+        """Remove expired entries and evict least recently used ones
+
+        Return number of removed entries
+        """
+        return 0
+
+    def stats(self):
+        """Return dict with number of entries and their size"""
+        return {}
+
+    def close(self):
+        """Prune cache, write pending changes and release storage"""
+        self.prune()
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class JsonCache(CacheBackend):
+    """Cache loaded from json file at once and rewritten on flush
+
+    Entries are changed by worker threads while cache may be flushed,
+    so snapshot of them is written
+    """
+
+    version = 2
+
+    def __init__(self, path, policy=CachePolicy()):
+        super().__init__(policy)
+        self.path = path
+        self.entries = {}  # word -> [value, created, accessed]
+        self.changed = False
+        self.lock = RLock()
+        self.write_lock = Lock()  # snapshots are written in order they're taken
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, "r", encoding="utf-8") as file:
+                data = json.load(file)
+            if data.get("version") == self.version and "entries" in data:
+                self.entries = data["entries"]
+            else:  # plain {word: value} written by previous versions
+                now = time.time()
+                self.entries = {word: [v, now, now] for word, v in data.items()}
+
+    def __getitem__(self, word):
+        with self.lock:
+            value, created, _ = self.entries[word]
+            now = time.time()
+            if self.policy.expired(value is None, created, now):
+                raise KeyError(word)
+            self.entries[word][2] = now
+            self.changed = True
+        return value
+
+    def __contains__(self, word):
+        with self.lock:
+            if word not in self.entries:
+                return False
+            value, created, _ = self.entries[word]
+        return not self.policy.expired(value is None, created, time.time())
+
+    def __setitem__(self, word, value):
+        now = time.time()
+        with self.lock:
+            self.entries[word] = [value, now, now]
+            self.changed = True
+
+    def __delitem__(self, word):
+        with self.lock:
+            del self.entries[word]
+            self.changed = True
+
+    def __iter__(self):
+        with self.lock:
+            return iter(list(self.entries))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def prune(self):
+        with self.lock:
+            return self._prune()
+
+    def _prune(self):
+        now = time.time()
+        removed = [
+            word
+            for word, (value, created, _) in self.entries.items()
+            if self.policy.expired(value is None, created, now)
+        ]
+        for word in removed:
+            del self[word]
+        recent = sorted(self.entries, key=lambda w: self.entries[w][2], reverse=True)
+        max_bytes = self.policy.max_size_mb * MB
+        total = 0
+        for i, word in enumerate(recent):
+            total += len(json.dumps(self.entries[word][0]))
+            if (self.policy.max_entries and i >= self.policy.max_entries) or (
+                max_bytes and total > max_bytes
+            ):
+                for evicted in recent[i:]:
+                    del self[evicted]
+                removed += recent[i:]
+                break
+        if removed:
+            logging.info("removed from cache: %d", len(removed))
+        return len(removed)
+
+    def stats(self):
+        now = time.time()
+        with self.lock:
+            entries = list(self.entries.values())
+        return {
+            "entries": len(entries),
+            "not found": sum(v is None for v, _, _ in entries),
+            "expired": sum(
+                self.policy.expired(v is None, created, now)
+                for v, created, _ in entries
+            ),
+            "bytes": sum(len(json.dumps(v)) for v, _, _ in entries),
+        }
+
+    def flush(self):
+        with self.write_lock:
+            with self.lock:
+                if not self.changed:
+                    return
+                entries = {word: list(entry) for word, entry in self.entries.items()}
+                self.changed = False
+            with open(self.path, "w", encoding="utf-8") as file:
+                json.dump({"version": self.version, "entries": entries}, file)
+
+
+class SqliteCache(CacheBackend):
+    """Cache stored in SQLite database
+
+    Words are looked up by primary key, new entries and access times
+    are written in one transaction per `batch_size` changes
+    """
+
+    version = 1
+
+    def __init__(self, path, policy=CachePolicy(), batch_size=CHUNK_SIZE):
+        super().__init__(policy)
+        self.path = path
+        self.batch_size = batch_size
+        self.pending = {}  # word -> value
+        self.touched = {}  # word -> access time
+        self.lock = RLock()  # connection is shared by worker threads
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self._create()
+
+    def _create(self):
+        """Create table of words if database is new"""
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        self.migrated = version >= self.version  # json cache is copied once
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS words (word TEXT PRIMARY KEY, "
+                "value TEXT NOT NULL, created REAL NOT NULL, "
+                "accessed REAL NOT NULL, size INTEGER NOT NULL)"
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS words_accessed ON words (accessed)"
+            )
+            self.connection.execute(f"PRAGMA user_version = {self.version}")
+
+    def __getitem__(self, word):
+        with self.lock:
+            if word in self.pending:
+                return self.pending[word]
+            row = self.connection.execute(
+                "SELECT value, created FROM words WHERE word = ?", (word,)
+            ).fetchone()
+            now = time.time()
+            if row is None or self.policy.expired(row[0] == "null", row[1], now):
+                raise KeyError(word)
+            self.touched[word] = now
+            self._flush_if_full()
+        return json.loads(row[0])
+
+    def __contains__(self, word):
+        with self.lock:
+            if word in self.pending:
+                return True
+            row = self.connection.execute(
+                "SELECT value = 'null', created FROM words WHERE word = ?", (word,)
+            ).fetchone()
+        return row is not None and not self.policy.expired(*row, time.time())
+
+    def __setitem__(self, word, value):
+        with self.lock:
+            self.pending[word] = value
+            self._flush_if_full()
+
+    def __delitem__(self, word):
+        with self.lock:
+            self.flush()
+            cursor = self.connection.execute(
+                "DELETE FROM words WHERE word = ?", (word,)
+            )
+            self.connection.commit()
+        if not cursor.rowcount:
+            raise KeyError(word)
+
+    def __iter__(self):
+        with self.lock:
+            self.flush()
+            words = self.connection.execute("SELECT word FROM words").fetchall()
+        return (word for (word,) in words)
+
+    def __len__(self):
+        with self.lock:
+            self.flush()
+            return self.connection.execute("SELECT COUNT(*) FROM words").fetchone()[0]
+
+    def clear(self):
+        """Remove all entries in one statement"""
+        with self.lock:
+            self.pending.clear()
+            self.touched.clear()
+            with self.connection:
+                self.connection.execute("DELETE FROM words")
+
+    def update(self, other=(), **kwargs):
+        """Insert many entries in one transaction"""
+        with self.lock:
+            self.pending.update(other, **kwargs)
+            self.flush()
+
+    def _flush_if_full(self):
+        if len(self.pending) + len(self.touched) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            if not self.pending and not self.touched:
+                return
+            now = time.time()
+            rows = []
+            for word, value in self.pending.items():
+                value = json.dumps(value)
+                rows.append((word, value, now, now, len(value)))
+            with self.connection:  # one transaction
+                self.connection.executemany(
+                    "UPDATE words SET accessed = ? WHERE word = ?",
+                    ((accessed, word) for word, accessed in self.touched.items()),
+                )
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO words "
+                    "(word, value, created, accessed, size) VALUES (?, ?, ?, ?, ?)",
+                    rows,
+                )
+            self.pending.clear()
+            self.touched.clear()
+
+    def prune(self):
+        now = time.time()
+        with self.lock:
+            self.flush()
+            with self.connection:
+                removed = self.connection.execute(
+                    "DELETE FROM words WHERE created < "
+                    "CASE WHEN value = 'null' THEN ? ELSE ? END",
+                    (self.policy.cutoff(True, now), self.policy.cutoff(False, now)),
+                ).rowcount
+                if self.policy.max_entries:
+                    removed += self.connection.execute(
+                        "DELETE FROM words WHERE word IN (SELECT word FROM words "
+                        "ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                        (self.policy.max_entries,),
+                    ).rowcount
+                if self.policy.max_size_mb:
+                    removed += self.connection.execute(
+                        "DELETE FROM words WHERE word IN (SELECT word FROM "
+                        "(SELECT word, SUM(size) OVER (ORDER BY accessed DESC) "
+                        "AS total FROM words) WHERE total > ?)",
+                        (self.policy.max_size_mb * MB,),
+                    ).rowcount
+        if removed:
+            logging.info("removed from cache: %d", removed)
+        return removed
+
+    def stats(self):
+        now = time.time()
+        with self.lock:
+            self.flush()
+            entries, not_found, expired, size = self.connection.execute(
+                "SELECT COUNT(*), TOTAL(value = 'null'), TOTAL(created < "
+                "CASE WHEN value = 'null' THEN ? ELSE ? END), TOTAL(size) FROM words",
+                (self.policy.cutoff(True, now), self.policy.cutoff(False, now)),
+            ).fetchone()
+        return {
+            "entries": entries,
+            "not found": int(not_found),
+            "expired": int(expired),
+            "bytes": int(size),
+        }
+
+    def close(self):
+        with self.lock:
+            super().close()
+            self.connection.close()
+
+    def migrate(self, json_path):
+        """Copy entries from json cache once, when database is created"""
+        with self.lock:
+            if self.migrated:
+                return
+            if os.path.exists(json_path) and os.path.getsize(json_path) > 0:
+                entries = JsonCache(json_path, self.policy).entries
+                self.update({word: entry[0] for word, entry in entries.items()})
+                logging.info("cache migrated from %s to %s", json_path, self.path)
+            self.migrated = True
+
+
+def sqlite_path(path):
+    """Path of SQLite database for cache with given json path"""
+    return str(Path(path).with_suffix(".sqlite3"))
+
+
+def open_cache(path=CACHED_WORDS_PATH, backend=CACHE_BACKEND, policy=CachePolicy()):
+    """Open cache with given backend ("json" or "sqlite")
+
+    For SQLite backend path of json cache is used to derive path
+    of database, existing json cache is migrated to it
+    """
+    match backend:
+        case "json":
+            return JsonCache(path, policy)
+        case "sqlite":
+            cache = SqliteCache(sqlite_path(path), policy)
+            cache.migrate(path)
+            return cache
+    raise ValueError(f"unknown cache backend: {backend}")
@@ -0,0 +1,120 @@
+"""
+This module provides checkpoint journal of imports
+
+Journal is append-only file with one json object per line. After each
+chunk of import, state of each word of the chunk is appended:
+ fetched - response is in cache, but note couldn't be made of it
+ rendered - note was made, but wasn't added to Anki
+ submitted - note was added to Anki
+ not found - word isn't in dictionary
+so if import is interrupted, resumed one skips submitted and not found
+words, and takes the others from cache. Wordlist files are recorded
+too, so unchanged wordlist isn't read again after complete import
+"""
+import json
+import logging
+import os
+import time
+from pathlib import Path
+
+from constants import *
+
+FETCHED = "fetched"
+RENDERED = "rendered"
+SUBMITTED = "submitted"
+NOT_FOUND = "not found"
+COMPLETED = {SUBMITTED, NOT_FOUND}  # nothing to do with these words
+
+
+class Journal:
+    """Journal of word states for each deck
+
+    Line that was being written when process was killed is ignored
+    """
+
+    def __init__(self, path=JOURNAL_PATH):
+        self.path = Path(path)
+        self.states = {}  # (deck, word) -> state
+        self.sources = {}  # (deck, path) -> [mtime, size]
+        self.lines = 0
+        if self.path.exists():
+            self._load()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self.lines > 2 * (len(self.states) + len(self.sources)) + 1000:
+            self._compact()
+        self.file = open(self.path, "a", encoding="utf-8")
+
+    def _load(self):
+        with open(self.path, "r", encoding="utf-8") as file:
+            for line in file:
+                self.lines += 1
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:  # torn write
+                    continue
+                if "source" in entry:
+                    key = (entry["deck"], entry["source"])
+                    self.sources[key] = [entry["mtime"], entry["size"]]
+                else:
+                    self.states[(entry["deck"], entry["word"])] = entry["state"]
+
+    def _compact(self):
+        """Rewrite journal with the last state of each word only"""
+        temp = self.path.with_name(f"{self.path.name}.part")
+        with open(temp, "w", encoding="utf-8") as file:
+            for (deck, word), state in self.states.items():
+                file.write(self._line(deck=deck, word=word, state=state))
+            for (deck, source), (mtime, size) in self.sources.items():
+                file.write(self._line(deck=deck, source=source, mtime=mtime, size=size))
+        os.replace(temp, self.path)
+        logging.info("journal compacted: %d lines", self.lines)
+
+    @staticmethod
+    def _line(**entry):
+        return json.dumps(entry, ensure_ascii=False) + "\n"
+
+    def completed(self, deck):
+        """Words that have nothing left to do in deck"""
+        return {
+            word
+            for (entry_deck, word), state in self.states.items()
+            if entry_deck == deck and state in COMPLETED
+        }
+
+    def record(self, deck, states):
+        """Append (word, state) pairs, written to disk on flush"""
+        for word, state in states:
+            self.states[(deck, word)] = state
+            self.file.write(self._line(deck=deck, word=word, state=state))
+
+    def flush(self):
+        """Write appended states to disk"""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def unchanged(self, deck, source):
+        """Check if wordlist file is the same as after complete import"""
+        stat = Path(source).stat()
+        return self.sources.get((deck, _key(source))) == [stat.st_mtime, stat.st_size]
+
+    def record_source(self, deck, source):
+        """Remember wordlist file imported completely"""
+        stat = Path(source).stat()
+        self.sources[(deck, _key(source))] = [stat.st_mtime, stat.st_size]
+        self.file.write(
+            self._line(
+                deck=deck,
+                source=_key(source),
+                mtime=stat.st_mtime,
+                size=stat.st_size,
+                time=time.time(),
+            )
+        )
+        self.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def _key(source):
+    return str(Path(source).resolve())
@@ -5,8 +5,53 @@ DECK_NAME = "Lazy English"
 WORDLIST_NAME = "words.txt"
 CACHED_WORDS_PATH = ".cache/cached_words.json"
 CACHE_ENABLED = True  # change to False to disable caching of added words
+CACHE_BACKEND = "sqlite"  # or "json" to keep cache in CACHED_WORDS_PATH
+CACHE_MAX_ENTRIES = 100_000  # least recently used words are evicted, 0 - no limit
+CACHE_MAX_SIZE_MB = 500  # 0 - no limit
+CACHE_TTL_DAYS = 180  # parsed words are fetched again after this time, 0 - never
+CACHE_NEGATIVE_TTL_DAYS = 7  # same for words not found in dictionary
 CACHE_PATH = ".cache/cache.json"
+FAILED_WORDS_PATH = ".cache/failed_words.txt"  # words to retry
+MEDIA_ENABLED = True  # change to False to let Anki download audio of each note
+MEDIA_PATH = ".cache/media"  # downloaded audio files
+MEDIA_CONCURRENCY = 8  # max number of audio downloads at once
+OFFLINE_ENABLED = False  # change to True to look words up without network
+OFFLINE_INDEX_PATH = ".cache/offline.sqlite3"  # built by offline.py
 CONFIG_PATH = "config.yaml"
+ANKI_CONNECT_HOST = "localhost"
+ANKI_CONNECT_PORT = 8765
+ANKI_CONNECT_TIMEOUT = 30  # seconds to wait for AnkiConnect response
+ANKI_CONNECT_CONNECT_TIMEOUT = 3  # seconds to wait for connection
+ANKI_CONNECT_RETRIES = 5  # reconnection attempts while Anki is starting
+ANKI_CONNECT_BACKOFF = 0.5  # delay before first reconnection, doubles each time
+DICTIONARY_API_URL = "https://api.dictionaryapi.dev/api/v2/entries/en/"
+DICTIONARY_PROVIDERS = ["cache", "offline", "api"]  # asked in this order
+ASYNC_ENABLED = True  # change to False to use thread pool instead of asyncio
+CONCURRENCY = 16  # max number of dictionary requests in flight
+CHUNK_SIZE = 50  # number of notes sent to Anki with one addNotes action
+RATE_LIMIT = 20  # initial number of dictionary requests per second
+RATE_LIMIT_MIN = 1
+RATE_LIMIT_MAX = 100
+RATE_LIMIT_INCREASE = 0.5  # added to rate after each successful request
+RATE_LIMIT_DECREASE = 0.5  # rate is multiplied by it after 429 or latency spike
+LATENCY_SPIKE_FACTOR = 5  # latency this many times above average is a spike
+FETCH_RETRIES = 3  # retries of dictionary request after 429, 5xx or timeout
+RETRY_BACKOFF = 1  # max delay before first retry in seconds, doubles each time
+RETRY_BACKOFF_MAX = 30
+HEDGE_ENABLED = False  # change to True to duplicate slow dictionary requests
+HEDGE_PERCENTILE = 95  # request is duplicated when it's slower than this share
+HEDGE_WINDOW = 200  # number of recent requests the percentile is taken from
+METRICS_ENABLED = False  # change to True to time stages of import, see metrics.py
+METRICS_REPORT_PATH = ".cache/run_report.json"
+METRICS_TRACE_PATH = ""  # file for Chrome trace of import, "" - don't write it
+PROFILE_PATH = ""  # file for cProfile stats of import, "" - don't profile
+STATE_SAVE_DELAY = 1  # seconds, changes of GUI state are written together
+GUI_LOG_LINES = 1000  # recent log lines kept in GUI
+GUI_LOG_FPS = 30  # max log updates per second in GUI
+GUI_MAX_JOBS = 1  # imports run at once by GUI, the others wait in queue
+JOURNAL_ENABLED = True  # change to False not to keep journal of imported words
+JOURNAL_PATH = ".cache/journal.jsonl"  # lets interrupted import be resumed
+IMPORT_DEADLINE = 0  # seconds for lookups, the rest is saved to retry, 0 - no limit
 DICTIONARIES = {
     "Oxford": False,
     "Cambridge": True,
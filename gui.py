@@ -1,11 +1,22 @@
 import functools
 import json
 import logging
+import os
 import shutil
+import time
+from collections import deque
 from pathlib import Path
-
-import yaml
-from PyQt6.QtCore import QObject, Qt, QThread, pyqtSignal
+from threading import Event, Lock, RLock, Timer
+
+from PyQt6.QtCore import (
+    QFileSystemWatcher,
+    QObject,
+    Qt,
+    QThread,
+    QTimer,
+    pyqtSignal,
+    pyqtSlot,
+)
 from PyQt6.QtGui import QKeySequence, QShortcut, QIcon
 from PyQt6.QtWidgets import (
     QApplication,
@@ -18,7 +29,10 @@ from PyQt6.QtWidgets import (
     QLabel,
     QLineEdit,
     QMessageBox,
+    QPlainTextEdit,
+    QProgressBar,
     QPushButton,
+    QSpinBox,
     QTabWidget,
     QTextEdit,
     QVBoxLayout,
@@ -26,36 +40,197 @@ from PyQt6.QtWidgets import (
 )
 
 import app
+import metrics
+import settings
 from constants import *
 
-modelName = MODEL_NAME
-deckName = DECK_NAME
-cacheEnabled = CACHE_ENABLED
-cachePath = CACHED_WORDS_PATH
-
 
 class Worker(QObject):
+    """Runs tasks one by one in thread it's moved to
+
+    Tasks are queued by Qt as signals, so task added while another
+    one runs isn't dropped. `done` of task is called in GUI thread
+    with its result
+    """
+
     started = pyqtSignal()
     finished = pyqtSignal()
+    queued = pyqtSignal(object, object)  # task, done
+    taskDone = pyqtSignal(object, object)  # done, result
 
     def __init__(self):
         super().__init__()
-        self._task = None
+        self.queued.connect(self.run)
+
+    def addTask(self, task, done=None):
+        self.queued.emit(task, done)
+
+    @pyqtSlot(object, object)  # run in thread of worker, not the one it's made in
+    def run(self, task, done=None):
+        self.started.emit()
+        try:
+            result = task()
+            if done is not None:
+                self.taskDone.emit(done, result)
+        except Exception:
+            logging.exception("Task failed")
+        finally:
+            self.finished.emit()
+
+
+class Job(QObject):
+    """Import of one list of words, runs in its own thread
+
+    Progress is reported with counts of fetched, submitted and failed words
+    """
+
+    progress = pyqtSignal(object)  # Job
+    finished = pyqtSignal(object)  # Job
+    progressInterval = 0.1  # seconds between progress signals
 
-    def setTask(self, task):
+    def __init__(self, number, words, task):
+        super().__init__()
+        self.number = number
+        self.words = words
         self._task = task
+        self.cancelEvent = Event()
+        self.fetched, self.submitted, self.failed = 0, 0, 0
+        self.total = len(words)  # unique words are known when job starts
+        self.lastProgress = 0.0
+
+        self.thread = QThread()
+        self.moveToThread(self.thread)
+        self.thread.started.connect(self.run)
 
     def run(self):
-        if self._task:
-            self.started.emit()
-            self._task()
-            self.finished.emit()
+        try:
+            report = self._task(
+                self.words, progress=self._reportProgress, cancel=self.cancelEvent
+            )
+            self._reportProgress(report, force=True)
+        except Exception:
+            logging.exception("Job %d failed", self.number)
+        finally:
+            self.finished.emit(self)
+
+    def _reportProgress(self, report, force=False):
+        now = time.monotonic()
+        if not force and now - self.lastProgress < self.progressInterval:
+            return
+        self.lastProgress = now
+        self.fetched, self.submitted = report.fetched, report.added
+        self.failed, self.total = len(report.failed), report.total
+        self.progress.emit(self)
+
+    def cancel(self):
+        """Stop job after current chunk"""
+        self.cancelEvent.set()
+
+
+class JobQueue(QObject):
+    """Jobs waiting to be run, at most `maxRunning` of them run at once"""
+
+    changed = pyqtSignal()
+
+    def __init__(self, maxRunning=GUI_MAX_JOBS):
+        super().__init__()
+        self.maxRunning = maxRunning
+        self.pending = deque()
+        self.running = []
+        self.count = 0
+
+    def add(self, words, task):
+        self.count += 1
+        job = Job(self.count, words, task)
+        job.progress.connect(self._progress)
+        job.finished.connect(self._finished)
+        self.pending.append(job)
+        logging.info("Job %d: %d words queued", job.number, len(words))
+        self._startNext()
+        return job
+
+    def jobs(self):
+        return self.running + list(self.pending)
+
+    def cancel(self):
+        """Drop queued jobs, stop running ones after current chunk"""
+        self.pending.clear()
+        for job in self.running:
+            job.cancel()
+        self.changed.emit()
+
+    def stop(self):
+        """Cancel jobs and wait for running ones, used on exit"""
+        running = list(self.running)
+        self.cancel()
+        if running:
+            logging.info("Waiting for %d running jobs to stop...", len(running))
+        for job in running:
+            job.thread.quit()  # event loop isn't entered after job is done
+            job.thread.wait()
+
+    def _startNext(self):
+        while self.pending and len(self.running) < self.maxRunning:
+            job = self.pending.popleft()
+            self.running.append(job)
+            job.thread.start()
+        self.changed.emit()
+
+    def _progress(self, job):
+        self.changed.emit()
+
+    def _finished(self, job):
+        job.thread.quit()
+        job.thread.wait()
+        self.running.remove(job)
+        self._startNext()
+
+
+class LogChannel(QObject):
+    """Lines of log shown in widget by GUI thread
+
+    Lines may be put from any thread, they are queued and appended
+    to widget in one batch at most `fps` times per second
+    """
+
+    pending = pyqtSignal()
+
+    def __init__(self, widget, maxLines=GUI_LOG_LINES, fps=GUI_LOG_FPS):
+        super().__init__()
+        self.widget = widget
+        self.lines = deque(maxlen=maxLines)  # older lines would be cut anyway
+        self.lock = Lock()
+        self.scheduled = False
+        self.interval = 1 / fps
+        self.lastFlush = 0.0
+        self.pending.connect(self._schedule)  # queued if put from other thread
+
+    def put(self, line):
+        with self.lock:
+            self.lines.append(line)
+            if self.scheduled:
+                return
+            self.scheduled = True
+        self.pending.emit()
+
+    def _schedule(self):
+        delay = self.lastFlush + self.interval - time.monotonic()
+        QTimer.singleShot(max(0, round(delay * 1000)), self._flush)
+
+    def _flush(self):
+        with self.lock:
+            lines = list(self.lines)
+            self.lines.clear()
+            self.scheduled = False
+        self.lastFlush = time.monotonic()
+        if lines:
+            self.widget.appendPlainText("\n".join(lines))
 
 
 class MainWindow(QDialog):
     """Main window (view)"""
 
-    def __init__(self):
+    def __init__(self, config=None):
         super().__init__()
         self.setWindowTitle(APP_NAME)
         self.setWindowIcon(QIcon("assets/logo.jpg"))
@@ -71,6 +246,7 @@ class MainWindow(QDialog):
         tabs.addTab(self._createAdvancedTab(), "Advanced")
 
         self._createShortcuts()
+        self.setConfig(config or settings.Config())
 
     def _createWordsTab(self):
         wordsLayout = QVBoxLayout()
@@ -81,6 +257,7 @@ class MainWindow(QDialog):
 
         subLayout.addWidget(self._createLogWidget())
         subLayout.addLayout(self._createButtonsLayout())
+        wordsLayout.addWidget(self._createProgressBar())
 
         widget = QWidget()
         widget.setLayout(wordsLayout)
@@ -131,6 +308,12 @@ class MainWindow(QDialog):
         logging.getLogger().setLevel(logging.INFO)
         return logWidget.widget
 
+    def _createProgressBar(self):
+        self.progressBar = QProgressBar()
+        self.progressBar.setFormat("No jobs")
+        self.progressBar.setValue(0)
+        return self.progressBar
+
     def _createButtonsLayout(self):
         buttonsLayout = QHBoxLayout()
         buttonsLayout.setAlignment(Qt.AlignmentFlag.AlignRight)
@@ -139,9 +322,11 @@ class MainWindow(QDialog):
             "Submit": QPushButton("Submit"),
             "Upload": QPushButton("Upload"),
             "Clear": QPushButton("Clear"),
+            "Cancel": QPushButton("Cancel"),
         }
         for button in self.buttons.values():
             buttonsLayout.addWidget(button)
+        self.buttons["Cancel"].setDisabled(True)
 
         return buttonsLayout
 
@@ -151,19 +336,38 @@ class MainWindow(QDialog):
         formLayout = QFormLayout()
 
         self.config = {
-            "modelName": QLineEdit(modelName),
-            "deckName": QLineEdit(deckName),
+            "modelName": QLineEdit(),
+            "deckName": QLineEdit(),
             "cacheEnabled": QCheckBox(),
-            "cachePath": QLineEdit(cachePath),
+            "cachePath": QLineEdit(),
+            "cacheMaxEntries": self._createSpinBox(),
+            "cacheMaxSizeMb": self._createSpinBox(),
+            "cacheTtlDays": self._createSpinBox(),
+            "cacheNegativeTtlDays": self._createSpinBox(),
         }
         formLayout.addRow("Name of anki model:", self.config["modelName"])
         formLayout.addRow("Name of anki deck:", self.config["deckName"])
         formLayout.addRow("Cache enabled:", self.config["cacheEnabled"])
         formLayout.addRow("Cache path:", self.config["cachePath"])
-        self.config["cacheEnabled"].setChecked(cacheEnabled)
+        formLayout.addRow(
+            "Max cached words (0 - no limit):", self.config["cacheMaxEntries"]
+        )
+        formLayout.addRow(
+            "Max cache size, MB (0 - no limit):", self.config["cacheMaxSizeMb"]
+        )
+        formLayout.addRow("Cached words expire in, days:", self.config["cacheTtlDays"])
+        formLayout.addRow(
+            "Not found words expire in, days:", self.config["cacheNegativeTtlDays"]
+        )
 
         return formLayout
 
+    @staticmethod
+    def _createSpinBox():
+        spinBox = QSpinBox()
+        spinBox.setRange(0, 10**9)
+        return spinBox
+
     def _createSettingsDictionariesLayout(self):
         dictionariesLayout = QVBoxLayout()
         gridLayout = QGridLayout()
@@ -187,18 +391,6 @@ class MainWindow(QDialog):
             gridLayout.addWidget(widget, row, column)
             column += 1
 
-        # set defaults
-        for dic, value in DICTIONARIES.items():
-            self.dictionaries[dic].setChecked(value)
-
-        # set from config
-        if fileExists(CONFIG_PATH):
-            with open(CONFIG_PATH, "r") as file:
-                config = yaml.safe_load(file)
-                if "dictionaries" in config:
-                    for dic, value in config["dictionaries"].items():
-                        self.dictionaries[dic].setChecked(value)
-
         return dictionariesLayout
 
     def _createSettingsButtonsLayout(self):
@@ -244,16 +436,43 @@ class MainWindow(QDialog):
         logging.info("Cleared")
 
     def setDefaults(self):
-        self.config["modelName"].setText(MODEL_NAME)
-        self.config["deckName"].setText(DECK_NAME)
-        self.config["cacheEnabled"].setChecked(CACHE_ENABLED)
-        self.config["cachePath"].setText(CACHED_WORDS_PATH)
-        for key, value in DICTIONARIES.items():
-            self.dictionaries[key].setChecked(value)
+        self.setConfig(settings.Config())
+
+    def setConfig(self, config):
+        """Show values of config (see settings) in Settings tab"""
+        for key, field in self.config.items():
+            value = getattr(config, settings.KEYS[key])
+            if isinstance(field, QCheckBox):
+                field.setChecked(value)
+            elif isinstance(field, QSpinBox):
+                field.setValue(value)
+            else:
+                field.setText(value)
+        self.config["cachePath"].setDisabled(not config.cache_enabled)
+        for key, checkbox in self.dictionaries.items():
+            checkbox.setChecked(config.dictionaries.get(key, False))
 
     def getInput(self):
         return self.inputField.toPlainText()
 
+    def setProgress(self, jobs):
+        """Show counts of running and queued jobs in progress bar"""
+        self.buttons["Cancel"].setDisabled(not jobs)
+        if not jobs:
+            self.progressBar.setFormat("No jobs")
+            self.progressBar.setMaximum(max(self.progressBar.maximum(), 1))
+            self.progressBar.setValue(self.progressBar.maximum())
+            return
+        fetched = sum(job.fetched for job in jobs)
+        total = sum(job.total for job in jobs)
+        self.progressBar.setMaximum(max(total, 1))
+        self.progressBar.setValue(fetched)
+        self.progressBar.setFormat(
+            f"Jobs: {len(jobs)}, fetched: {fetched}/{total}, "
+            f"submitted: {sum(job.submitted for job in jobs)}, "
+            f"failed: {sum(job.failed for job in jobs)}"
+        )
+
     def setInput(self, text):
         self.inputField.setText(text)
         self.setFocusOnInput()
@@ -266,39 +485,40 @@ class MainWindow(QDialog):
         self.inputField.setTextCursor(cursor)  # set cursor at the end
 
     def getConfig(self):
-        """Return non-default values from Settings tab"""
-        config = {}
-
-        constants = [MODEL_NAME, DECK_NAME, CACHE_ENABLED, CACHED_WORDS_PATH]
-        for const, (key, field) in zip(constants, self.config.items()):
-            value = field.text() if key != "cacheEnabled" else field.isChecked()
-            if const != value:
-                config[key] = value
-
-        for const, (key, checkbox) in zip(
-            DICTIONARIES.values(), self.dictionaries.items()
-        ):
-            value = checkbox.isChecked()
-
-            if const != value:
-                if "dictionaries" not in config:
-                    config["dictionaries"] = {}
-                config["dictionaries"][key] = value
-
-        return config
+        """Return config (see settings) with values from Settings tab"""
+        values = {}
+        for key, field in self.config.items():
+            if isinstance(field, QCheckBox):
+                values[key] = field.isChecked()
+            elif isinstance(field, QSpinBox):
+                values[key] = field.value()
+            else:
+                values[key] = field.text()
+        values["dictionaries"] = {
+            key: checkbox.isChecked() for key, checkbox in self.dictionaries.items()
+        }
+        return settings.Config.from_dict(values)
 
     ## helper classes
 
     class QTextEditLogger(logging.Handler):
-        """Logging widget"""
+        """Logging widget, keeps GUI_LOG_LINES recent lines
+
+        Records may come from any thread, see LogChannel
+        """
 
         def __init__(self):
             super().__init__()
-            self.widget = QLabel()
+            self.widget = QPlainTextEdit()
+            self.widget.setReadOnly(True)
+            self.widget.setMaximumBlockCount(GUI_LOG_LINES)
+            self.channel = LogChannel(self.widget)
 
         def emit(self, record):
-            msg = self.format(record)
-            self.widget.setText(msg)
+            try:
+                self.channel.put(self.format(record))
+            except Exception:
+                self.handleError(record)
 
     class WarningDialog(QMessageBox):
         def __init__(self):
@@ -318,8 +538,7 @@ class MainWindow(QDialog):
 def threading(func):
     def wrapper(self, *args, **kwargs):
         funcWithArgs = functools.partial(func, self, *args, **kwargs)
-        self.worker.setTask(funcWithArgs)
-        self.thread.start()
+        self.worker.addTask(funcWithArgs)
 
     return wrapper
 
@@ -331,7 +550,9 @@ class Controller:
         self._view = view
         self._model = model
 
+        self.jobs = JobQueue()
         self._initializeThread()
+        self._initializeConfigWatcher()
         self._connectSignalsAndSlots()
         self._initializeModel()
 
@@ -339,9 +560,18 @@ class Controller:
         self.thread = QThread()
         self.worker = Worker()
         self.worker.moveToThread(self.thread)
+        self.worker.taskDone.connect(lambda done, result: done(result))
+        self.thread.start()
 
-        self.thread.started.connect(self.worker.run)
-        self.worker.finished.connect(self.thread.quit)
+    def _initializeConfigWatcher(self):
+        """Reload config when config file is changed, created or removed"""
+        configPath = self._model.configHandler.configPath
+        self.configWatcher = QFileSystemWatcher()
+        self.configWatcher.addPath(str(Path(configPath).resolve().parent))
+        if fileExists(configPath):
+            self.configWatcher.addPath(configPath)
+        self.configWatcher.fileChanged.connect(self._configFileChanged)
+        self.configWatcher.directoryChanged.connect(self._configFileChanged)
 
     def _connectSignalsAndSlots(self):
         self._view.buttons["Submit"].clicked.connect(
@@ -349,16 +579,17 @@ class Controller:
         )
         self._view.buttons["Upload"].clicked.connect(self.uploadFile)
         self._view.buttons["Clear"].clicked.connect(self._view.clearInput)
+        self._view.buttons["Cancel"].clicked.connect(self.jobs.cancel)
+        self.jobs.changed.connect(lambda: self._view.setProgress(self.jobs.jobs()))
 
-        self._view.settingsButtons["Save"].clicked.connect(self.saveConfig)
         self._view.settingsButtons["Save"].clicked.connect(
-            lambda checked: self._view.settingsLabel.setText("Please restart the app")
+            lambda checked: self.saveConfig()
         )
         self._view.settingsButtons["Set defaults"].clicked.connect(
             self._view.setDefaults
         )
         self._view.settingsButtons["Set defaults"].clicked.connect(
-            lambda checked: self._view.settingsLabel.setText("Please restart the app")
+            lambda checked: self._view.settingsLabel.setText("Press Save to apply")
         )
         self._view.config["cacheEnabled"].clicked.connect(
             lambda checked: self._view.config["cachePath"].setDisabled(not checked)
@@ -382,10 +613,21 @@ class Controller:
     def _initializeModel(self):
         self._model._initializeApp()
 
-    @threading
+    def _applyConfig(self, parts):
+        self.worker.addTask(
+            functools.partial(self._model.applyConfig, parts), self._configApplied
+        )
+
+    def _configApplied(self, parts):
+        if parts:
+            self._view.settingsLabel.setText(f"Applied: {', '.join(sorted(parts))}")
+        else:
+            self._view.settingsLabel.setText("Not applied, see log")
+
     def createNotes(self):
-        words = self._view.inputField.toPlainText().split()
-        self._model._createNotes(words)
+        words = self._view.inputField.toPlainText().splitlines()
+        if words:
+            self.jobs.add(words, self._model._createNotes)
 
     def uploadFile(self):
         filename = QFileDialog.getOpenFileName()[0]
@@ -395,23 +637,43 @@ class Controller:
                 self._view.setInput(words)
 
     def saveConfig(self):
-        currentConfig = self._view.getConfig()
-        self._model.configHandler.updateConfigFile(currentConfig)
-
-        initialConfig = self._model.configHandler.initialConfig
-        cache = self._model.cacheHandler.cache()
-
-        if initialConfig != currentConfig:
-            cache["Config changed"] = True
-        else:
-            cache["Config changed"] = False
-
-        self._model.cacheHandler.updateCacheFile(cache)
+        self._model.configHandler.updateConfigFile(self._view.getConfig())
+        if not self.reloadConfig():
+            self._view.settingsLabel.setText("Saved")
+
+    def reloadConfig(self):
+        """Load config from file and rebuild parts of the app it changes
+
+        Return changed parts (see settings.PARTS)
+        """
+        parts = self._model.configHandler.reload()
+        if parts:
+            self._view.setConfig(self._model.configHandler.config)
+            if {"model", "deck"} & parts:
+                # set before task is run, so it's retried on next start
+                self._model.cacheHandler.updateConfigChanged(True)
+            self._view.settingsLabel.setText("Applying...")
+            self._applyConfig(parts)
+        return parts
+
+    def _configFileChanged(self, path):
+        configPath = self._model.configHandler.configPath
+        if fileExists(configPath) and configPath not in self.configWatcher.files():
+            self.configWatcher.addPath(configPath)  # file was replaced by editor
+        self.reloadConfig()
+
+    def close(self):
+        """Stop jobs and worker, used on exit"""
+        self.jobs.stop()
+        self.thread.quit()  # queued tasks are dropped, see reloadConfig
+        self.thread.wait()
 
     def clearData(self):
         confirmed = self._view._runWarningDialog()
         if confirmed:
             self._model.deleteData()
+            self._model.configHandler.reload()  # defaults aren't applied until restart
+            self._view.setConfig(self._model.configHandler.config)
 
 
 class Model:
@@ -426,127 +688,173 @@ class Model:
         app.open_anki()
 
         if self.cacheHandler.configChanged():
-            dicts = self.configHandler.initialConfig.get("dictionaries", {})
+            self._createModelAndDeck()
 
-            if modelName not in app.invoke("modelNames"):
-                app.invoke(
-                    "createModel", **app.get_model(model_name=modelName, links=dicts)
-                )
-            if deckName not in app.invoke("deckNames"):
-                app.invoke("createDeck", deck=deckName)
+        logging.info("Ready to use")
 
+    def _createModelAndDeck(self):
+        config = self.configHandler.config
+        app.create_model_and_deck(
+            config.model_name, config.deck_name, links=config.dictionaries
+        )
+        if self.configHandler.config is config:  # no newer config to apply
             self.cacheHandler.updateConfigChanged(False)
-            self.cacheHandler.updateCreated(modelName, deckName)
-
-        logging.info("Ready to use")
+        self.cacheHandler.updateCreated(config.model_name, config.deck_name)
+
+    def applyConfig(self, parts):
+        """Rebuild parts of the app changed by new config (see settings.PARTS)
+
+        Cache is opened by each import, so new cache settings are used
+        by next one, imports that already run keep their config.
+        Return applied parts, empty set if they weren't applied
+        """
+        if {"model", "deck"} & parts:
+            try:
+                self._createModelAndDeck()
+            except app.requests.exceptions.RequestException as error:
+                logging.warning("Failed to apply settings: %s", error)
+                return set()
+        logging.info("Settings applied: %s", ", ".join(sorted(parts)))
+        return parts
 
     def deleteData(self):
         cache = self.cacheHandler.cache()
-        app.invoke("deleteDecks", decks=cache["Created decks"], cardsToo=True)
+        app.invoke("deleteDecks", decks=cache.get("Created decks", []), cardsToo=True)
 
         self.cacheHandler.deleteCacheFile()
         self.configHandler.deleteConfigFile()
 
-    @staticmethod
-    def _createNotes(words):
+    def _createNotes(self, words, progress=None, cancel=None):
         logging.info("Creating cards...")
-        cache = app.load_cache() if cacheEnabled else {}
-        app.invoke(
-            "addNotes",
-            notes=app.get_notes(
-                words, cache=cache, model_name=modelName, deck_name=deckName
-            ),
-        )
-        if cacheEnabled:
-            with open(cachePath, "w", encoding="utf-8") as file:
-                json.dump(cache, file, indent=2)
-        logging.info("Сards created")
+        config = self.configHandler.config  # kept till the end of import
+        with metrics.run():
+            cache = {}
+            if config.cache_enabled:
+                policy = config.cache_policy()
+                cache = app.load_cache(config.cache_path, policy=policy)
+            try:
+                report = app.add_notes(
+                    words,
+                    cache=cache,
+                    model_name=config.model_name,
+                    deck_name=config.deck_name,
+                    progress=progress,
+                    cancel=cancel,
+                )
+            finally:
+                if config.cache_enabled:
+                    app.save_cache(cache)
+        logging.info("Сards created (%s)", report.summary())
+        return report
 
 
 class ConfigHandler:
+    """Current config of the app (see settings)"""
+
     def __init__(self, configPath):
         self.configPath = configPath
-
-        self.initialConfig = {}
-        if fileExists(self.configPath):
-            with open(self.configPath, "r") as file:
-                self.initialConfig = yaml.safe_load(file)
+        self.config = settings.load(configPath)
+
+    def reload(self):
+        """Load config from file, return parts of the app it changes"""
+        try:
+            config = settings.load(self.configPath)
+        except (OSError, ValueError, TypeError) as error:
+            logging.warning("Config isn't loaded: %s", error)
+            return set()
+        parts = self.config.changed_parts(config)
+        if parts:  # equal config isn't swapped, see Model._createModelAndDeck
+            self.config = config
+        return parts
 
     def updateConfigFile(self, config):
-        if config:  # config is not default
-            with open(CONFIG_PATH, "w") as configFile:
-                yaml.safe_dump(config, configFile)
-        else:
-            self.deleteConfigFile()
+        settings.save(config, self.configPath)
 
     def deleteConfigFile(self):
         deleteFile(self.configPath)
 
 
 class CacheHandler:
-    def __init__(self, cachePath):
+    """State of the app: created models and decks, whether config changed
+
+    State is loaded once and kept in memory, changes are written at most
+    once per STATE_SAVE_DELAY seconds to temporary file which then
+    replaces cache file, so the file is never left half-written.
+    Methods may be called from any thread
+    """
+
+    def __init__(self, cachePath, saveDelay=STATE_SAVE_DELAY):
         self.cachePath = cachePath
+        self.saveDelay = saveDelay
+        self.lock = RLock()
+        self.timer = None  # pending save
+        self.data = self._load()
+
+    def _load(self):
+        if not fileExists(self.cachePath):
+            return {}
+        try:
+            with open(self.cachePath, "r") as cacheFile:
+                return json.load(cacheFile)
+        except json.JSONDecodeError as error:
+            logging.warning("State file is broken, it's reset (%s)", error)
+            return {}
 
     def cache(self):
-        with open(self.cachePath, "r") as cacheFile:
-            return json.load(cacheFile)
+        with self.lock:
+            return json.loads(json.dumps(self.data))  # deep copy
 
     def configChanged(self):
-        if fileExists(self.cachePath):
-            return self.cache()["Config changed"]
-
-        return True  # no cache on first start
+        with self.lock:
+            return self.data.get("Config changed", True)  # True on first start
 
     def updateConfigChanged(self, configChanged):
-        createFile(self.cachePath, exist_ok=True)
-        with open(self.cachePath, "r+") as file:
-            if fileNotEmpty(self.cachePath):
-                data = json.load(file)
-                file.seek(0)
-            else:
-                data = {}
-            data["Config changed"] = configChanged
-            json.dump(data, file, indent=2)
+        with self.lock:
+            self.data["Config changed"] = configChanged
+            self._scheduleSave()
 
     def updateCreated(self, modelName, deckName):
-        with open(self.cachePath, "r+") as file:
-            data = json.load(file)
-            file.seek(0)
-
-            if "Created models" and "Created decks" in data:
-                if modelName not in data["Created models"]:
-                    data["Created models"].append(modelName)
-                if deckName not in data["Created decks"]:
-                    data["Created decks"].append(deckName)
-            else:
-                currentData = {
-                    "Created models": [modelName],
-                    "Created decks": [deckName],
-                }
-                data.update(currentData)
-
-            json.dump(data, file, indent=2)
+        with self.lock:
+            models = self.data.setdefault("Created models", [])
+            decks = self.data.setdefault("Created decks", [])
+            if modelName not in models:
+                models.append(modelName)
+            if deckName not in decks:
+                decks.append(deckName)
+            self._scheduleSave()
 
     def updateCacheFile(self, cache):
-        with open(self.cachePath, "w") as cacheFile:
-            json.dump(cache, cacheFile, indent=2)
+        with self.lock:
+            self.data = json.loads(json.dumps(cache))
+            self._scheduleSave()
+
+    def _scheduleSave(self):
+        if self.timer is None:
+            self.timer = Timer(self.saveDelay, self.save)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def save(self):
+        """Write pending changes now"""
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            writeAtomically(self.cachePath, json.dumps(self.data, indent=2))
+
+    def close(self):
+        with self.lock:
+            if self.timer is not None:
+                self.save()
 
     def deleteCacheFile(self):
-        deleteFile(self.cachePath)
-        shutil.rmtree(".cache")
-
-
-def loadConfig():
-    if fileExists(CONFIG_PATH):
-        with open(CONFIG_PATH, "r") as file:
-            config = yaml.safe_load(file)
-            globals().update(config)
-
-
-def createFile(filename, exist_ok):
-    Path(filename).parent.mkdir(parents=True, exist_ok=exist_ok)
-    Path(filename).touch(exist_ok=exist_ok)
-    return filename
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            self.data = {}
+            deleteFile(self.cachePath)
+            shutil.rmtree(".cache", ignore_errors=True)
 
 
 def deleteFile(filename):
@@ -557,18 +865,27 @@ def fileExists(filename):
     return Path(filename).is_file()
 
 
-def fileNotEmpty(filename):
-    return Path(filename).stat().st_size != 0
+def writeAtomically(filename, text):
+    """Write text to temporary file, then replace file with it"""
+    Path(filename).parent.mkdir(parents=True, exist_ok=True)
+    temp = f"{filename}.tmp"
+    with open(temp, "w") as file:
+        file.write(text)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp, filename)
 
 
 def main():
-    loadConfig()
     app = QApplication([])
-    dialog = MainWindow()
-    controller = Controller(view=dialog, model=Model())
+    model = Model()
+    dialog = MainWindow(model.configHandler.config)
+    controller = Controller(view=dialog, model=model)
 
     dialog.show()
     app.exec()
+    controller.close()  # imports save cache and retry list when stopped
+    model.cacheHandler.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,206 @@
+"""
+This module provides command line interface for headless imports,
+it doesn't load PyQt6
+
+Import words from files, or from stdin if no file or "-" is given:
+ python -m lazy_english import words.txt --deck "Lazy English" --concurrency 32
+ cat words.txt | python -m lazy_english import --chunk 100 --offline --report out.json
+
+Manage cache of parsed words:
+ python -m lazy_english cache stats
+ python -m lazy_english cache prune
+ python -m lazy_english cache clear
+
+Defaults of options are taken from config (see settings.py) and
+constants.py. Exit status is 1
+if some words are left to retry (see FAILED_WORDS_PATH)
+"""
+import argparse
+import fileinput
+import logging
+import sys
+from pathlib import Path
+
+import app
+import cache_store
+import checkpoint
+import metrics
+import settings
+from constants import *
+
+
+def read_words(paths):
+    """Yield lines of files one by one, "-" is stdin"""
+    with fileinput.input(paths or ["-"], encoding="utf-8") as lines:
+        for line in lines:
+            yield line.rstrip("\r\n")
+
+
+def sources(paths):
+    """Wordlist files that can be checked for changes, None if stdin is read"""
+    if not paths or "-" in paths:
+        return None
+    return [str(Path(path)) for path in paths]
+
+
+def import_words(args):
+    """Add notes for words of given files to Anki, return exit status"""
+    app.client = app.AnkiConnectClient(args.host, args.port)
+    journal = checkpoint.Journal(args.journal) if args.journal else None
+    files = sources(args.files)
+    if (
+        args.resume
+        and journal is not None
+        and files is not None
+        and all(journal.unchanged(args.deck, path) for path in files)
+    ):
+        logging.info("wordlists haven't changed since last import")
+        journal.close()
+        return 0
+
+    if args.report:
+        metrics.recorder.enabled = True
+        metrics.recorder.report_path = args.report
+    config = args.config
+    with metrics.run() as recorder:
+        app.create_model_and_deck(args.model, args.deck, config.dictionaries)
+        cache = {}
+        if args.cache:
+            cache = app.load_cache(
+                args.cache, args.cache_backend, config.cache_policy()
+            )
+        try:
+            report = app.add_notes(
+                read_words(args.files),
+                chunk_size=args.chunk,
+                failed_path=args.failed,
+                download_media=args.media,
+                offline=args.offline,
+                deadline=args.deadline,
+                journal=journal,
+                resume=args.resume,
+                cache=cache,
+                deck_name=args.deck,
+                model_name=args.model,
+                concurrency=args.concurrency,
+            )
+            if journal is not None and files is not None and report.complete:
+                for path in files:
+                    journal.record_source(args.deck, path)
+        finally:  # keep parsed words even if import was interrupted
+            if args.cache:
+                app.save_cache(cache)
+            if journal is not None:
+                journal.close()
+    if recorder.enabled:
+        logging.info("stages: %s", recorder.summary())
+    return 0 if report.complete else 1
+
+
+def manage_cache(args):
+    """Show stats of cache, prune or clear it, return exit status"""
+    policy = args.config.cache_policy()
+    cache = cache_store.open_cache(args.path, args.backend, policy)
+    try:
+        match args.action:
+            case "prune":
+                cache.prune()
+            case "clear":
+                cache.clear()
+                logging.info("cache cleared")
+        for key, value in cache.stats().items():
+            print(f"{key}: {value}")
+    finally:
+        cache.close()
+    return 0
+
+
+def make_parser(config):
+    """Create parser of command line arguments, defaults are taken from config"""
+    parser = argparse.ArgumentParser(
+        prog="lazy_english", description="Create Anki cards for English words"
+    )
+    parser.set_defaults(config=config)
+    parser.add_argument("-q", "--quiet", action="store_true", help="log warnings only")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    parser_import = commands.add_parser("import", help="add words to Anki")
+    parser_import.set_defaults(run=import_words)
+    parser_import.add_argument(
+        "files", nargs="*", help='wordlists, one word per line ("-" - stdin)'
+    )
+    parser_import.add_argument("--deck", default=config.deck_name)
+    parser_import.add_argument("--model", default=config.model_name)
+    parser_import.add_argument(
+        "--concurrency",
+        type=int,
+        default=CONCURRENCY,
+        help="max number of dictionary requests in flight",
+    )
+    parser_import.add_argument(
+        "--chunk", type=int, default=CHUNK_SIZE, help="notes per addNotes action"
+    )
+    parser_import.add_argument(
+        "--offline",
+        action="store_true",
+        default=OFFLINE_ENABLED,
+        help="don't use network for lookups",
+    )
+    parser_import.add_argument(
+        "--no-media",
+        dest="media",
+        action="store_false",
+        default=MEDIA_ENABLED,
+        help="let Anki download audio itself",
+    )
+    parser_import.add_argument(
+        "--deadline",
+        type=float,
+        default=IMPORT_DEADLINE,
+        help="seconds for lookups, the rest is saved to retry, 0 - no limit",
+    )
+    parser_import.add_argument(
+        "--resume", action="store_true", help="skip words done by previous imports"
+    )
+    parser_import.add_argument(
+        "--report", help="write run report as json (see metrics.py)"
+    )
+    parser_import.add_argument("--failed", default=FAILED_WORDS_PATH)
+    parser_import.add_argument(
+        "--cache",
+        default=config.cache_path if config.cache_enabled else "",
+        help='cache of parsed words ("" - no cache)',
+    )
+    parser_import.add_argument(
+        "--cache-backend", default=CACHE_BACKEND, choices=["json", "sqlite"]
+    )
+    parser_import.add_argument(
+        "--journal",
+        default=JOURNAL_PATH if JOURNAL_ENABLED else "",
+        help='checkpoint journal ("" - no journal)',
+    )
+    parser_import.add_argument("--host", default=ANKI_CONNECT_HOST)
+    parser_import.add_argument("--port", type=int, default=ANKI_CONNECT_PORT)
+
+    parser_cache = commands.add_parser("cache", help="manage cache of parsed words")
+    parser_cache.set_defaults(run=manage_cache)
+    parser_cache.add_argument("action", choices=["stats", "prune", "clear"])
+    parser_cache.add_argument("--path", default=config.cache_path)
+    parser_cache.add_argument(
+        "--backend", default=CACHE_BACKEND, choices=["json", "sqlite"]
+    )
+    return parser
+
+
+def main(argv=None):
+    """Run command given in command line"""
+    args = make_parser(settings.load()).parse_args(argv)
+    logging.basicConfig(
+        level=logging.WARNING if args.quiet else logging.INFO,
+        format="%(levelname)s - %(message)s",
+    )
+    return args.run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""
+This module provides local store of pronunciation files
+
+Audio is downloaded once, stored by hash of its content and uploaded
+to Anki with storeMediaFile under short stable name, so notes refer
+to it with [sound:...] instead of making Anki download it for each note
+"""
+import hashlib
+import logging
+import os
+from pathlib import Path, PurePosixPath
+from threading import get_ident
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import cache_store
+import scheduler
+from constants import *
+
+
+class MediaStore:
+    """Content-addressed store of audio files
+
+    `folder` keeps files named by sha256 of their content and index
+    that maps source urls to these names
+    """
+
+    prefix = "lazy_english_"
+
+    def __init__(self, folder=MEDIA_PATH, concurrency=MEDIA_CONCURRENCY):
+        self.folder = Path(folder)
+        self.concurrency = concurrency
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.index = cache_store.SqliteCache(
+            str(self.folder / "index.sqlite3"), cache_store.CachePolicy(0, 0, 0, 0)
+        )  # url -> filename
+        self.uploaded = None  # names of files in Anki, requested on first use
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_maxsize=concurrency))
+
+    def download(self, url):
+        """Download file unless its url is known, return its filename
+
+        Return None if download failed
+        """
+        if url in self.index:
+            return self.index[url]
+        try:
+            response = self.session.get(url, timeout=30)
+            response.raise_for_status()
+        except requests.exceptions.RequestException as error:
+            logging.warning("failed to download %s: %s", url, error)
+            return None
+        suffix = PurePosixPath(urlparse(url).path).suffix or ".mp3"
+        digest = hashlib.sha256(response.content).hexdigest()
+        filename = f"{self.prefix}{digest[:16]}{suffix}"
+        path = self.folder / filename
+        if not path.exists():  # the same clip may come from different urls
+            temp = path.with_name(f"{filename}.{get_ident()}.part")
+            temp.write_bytes(response.content)
+            os.replace(temp, path)
+        self.index[url] = filename
+        return filename
+
+    def upload(self, filenames, client):
+        """Store files in Anki collection unless they are there already"""
+        if self.uploaded is None:
+            try:
+                self.uploaded = set(
+                    client.invoke("getMediaFilesNames", pattern=f"{self.prefix}*")
+                )
+            except requests.exceptions.RequestException:
+                self.uploaded = set()  # older AnkiConnect, upload everything
+        filenames = sorted(set(filenames) - self.uploaded)
+        if not filenames:
+            return
+        client.invoke_many(
+            {
+                "action": "storeMediaFile",
+                "params": {
+                    "filename": filename,
+                    "path": str((self.folder / filename).resolve()),
+                },
+                "version": 6,
+            }
+            for filename in filenames
+        )
+        self.uploaded.update(filenames)
+        logging.info("audio files uploaded: %d", len(filenames))
+
+    def attach(self, notes, client):
+        """Replace remote audio of notes with files uploaded to Anki
+
+        Notes which audio couldn't be downloaded or uploaded
+        keep remote urls, Anki downloads them itself
+        """
+        urls = {note["audio"][0]["url"] for note in notes if note.get("audio")}
+        filenames = dict(
+            zip(urls, scheduler.imap(self.download, urls, self.concurrency))
+        )
+        try:
+            self.upload(filter(None, filenames.values()), client)
+        except requests.exceptions.RequestException as error:
+            logging.warning("failed to upload audio files: %s", error)
+            return notes
+        return [self._attach_file(note, filenames) for note in notes]
+
+    @staticmethod
+    def _attach_file(note, filenames):
+        if not note.get("audio"):
+            return note
+        filename = filenames.get(note["audio"][0]["url"])
+        if filename is None:
+            return note
+        fields = dict(note["fields"])
+        for field in note["audio"][0]["fields"]:
+            fields[field] = f"[sound:{filename}]"
+        return note | {"fields": fields, "audio": None}
+
+    def close(self):
+        """Save index of downloaded files"""
+        self.index.close()
+        self.session.close()
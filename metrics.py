@@ -0,0 +1,198 @@
+"""
+This module provides instrumentation of import
+
+Stages of import (loading cache, lookups by each provider, rendering
+notes, uploading audio, adding notes, saving cache) are timed and
+counters (cache hits and misses, bytes fetched, retries) are kept by
+shared recorder. After each run its report is written as json, and
+optionally as Chrome trace (open it in chrome://tracing or Perfetto).
+The run can also be profiled with cProfile.
+
+Everything is off by default, turn it on in constants.py or with
+environment variables:
+ LAZY_ENGLISH_METRICS=1 - write report to METRICS_REPORT_PATH
+ LAZY_ENGLISH_TRACE=trace.json - write Chrome trace
+ LAZY_ENGLISH_PROFILE=import.prof - write cProfile stats of thread that runs import
+"""
+import asyncio
+import contextlib
+import cProfile
+import json
+import logging
+import os
+import time
+from collections import Counter
+from pathlib import Path
+from threading import Lock, get_ident
+
+from constants import *
+
+
+class Metrics:
+    """Timers of stages and counters of one run
+
+    Time of stage is summed over all its calls, so stages that run
+    concurrently may take longer than the whole run
+    """
+
+    def __init__(
+        self,
+        enabled=METRICS_ENABLED or bool(os.environ.get("LAZY_ENGLISH_METRICS")),
+        report_path=METRICS_REPORT_PATH,
+        trace_path=os.environ.get("LAZY_ENGLISH_TRACE", METRICS_TRACE_PATH),
+        profile_path=os.environ.get("LAZY_ENGLISH_PROFILE", PROFILE_PATH),
+    ):
+        self.report_path = report_path
+        self.trace_path = trace_path
+        self.profile_path = profile_path
+        self.enabled = enabled or bool(trace_path)
+        self.lock = Lock()
+        self.reset()
+
+    def reset(self):
+        """Forget measurements of previous run"""
+        self.started = time.perf_counter()
+        self.timers = {}  # stage -> [calls, seconds]
+        self.counters = Counter()
+        self.events = []  # Chrome trace events
+        self.results = {}  # summary of run added by caller
+
+    @contextlib.contextmanager
+    def _measure(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self.lock:
+                timer = self.timers.setdefault(name, [0, 0.0])
+                timer[0] += 1
+                timer[1] += elapsed
+                if self.trace_path:
+                    self.events.append(
+                        {
+                            "name": name,
+                            "ph": "X",
+                            "ts": (started - self.started) * 1e6,
+                            "dur": elapsed * 1e6,
+                            "pid": os.getpid(),
+                            "tid": _track(),
+                        }
+                    )
+
+    def stage(self, name):
+        """Context manager that times stage"""
+        if not self.enabled:
+            return contextlib.nullcontext()
+        return self._measure(name)
+
+    def count(self, name, value=1):
+        """Increase counter"""
+        if self.enabled:
+            with self.lock:
+                self.counters[name] += value
+
+    def report(self):
+        """Get report of run as dict"""
+        with self.lock:
+            return {
+                "elapsed": time.perf_counter() - self.started,
+                "stages": {
+                    name: {"calls": calls, "seconds": seconds}
+                    for name, (calls, seconds) in self.timers.items()
+                },
+                "counters": dict(self.counters),
+                "results": self.results,
+            }
+
+    def summary(self):
+        """One line with time of each stage and counters"""
+        with self.lock:
+            stages = ", ".join(
+                f"{name} {seconds:.2f}s" for name, (_, seconds) in self.timers.items()
+            )
+            counters = ", ".join(
+                f"{name}: {_format_count(name, value)}"
+                for name, value in self.counters.items()
+            )
+        return "; ".join(filter(None, (stages, counters)))
+
+    def write(self):
+        """Write report and trace of run"""
+        if not self.enabled:
+            return
+        Path(self.report_path).parent.mkdir(parents=True, exist_ok=True)
+        with open(self.report_path, "w", encoding="utf-8") as file:
+            json.dump(self.report(), file, indent=2)
+        logging.info("run report is saved to %s", self.report_path)
+        if self.trace_path:
+            Path(self.trace_path).parent.mkdir(parents=True, exist_ok=True)
+            with open(self.trace_path, "w", encoding="utf-8") as file:
+                with self.lock:
+                    json.dump({"traceEvents": self.events}, file)
+            logging.info("trace is saved to %s", self.trace_path)
+
+
+def _track():
+    """Id of trace track: current asyncio task or thread"""
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:  # no running event loop
+        task = None
+    return id(task) if task is not None else get_ident()
+
+
+def _format_count(name, value):
+    if name.startswith("bytes"):
+        if value < 2**20:
+            return f"{value / 2**10:.1f} KB"
+        return f"{value / 2**20:.1f} MB"
+    return str(value)
+
+
+recorder = Metrics()  # shared by all modules
+runs = 0  # runs in progress, see run
+runs_lock = Lock()
+
+
+def stage(name):
+    """Time stage with shared recorder"""
+    return recorder.stage(name)
+
+
+def count(name, value=1):
+    """Increase counter of shared recorder"""
+    recorder.count(name, value)
+
+
+@contextlib.contextmanager
+def run():
+    """Measure one run: reset shared recorder, write its report afterwards
+
+    Runs that overlap (e.g. jobs of GUI) are measured as one: recorder
+    is reset by the first of them and report is written by the last one,
+    its results are of the run that ended last. Thread of the first
+    one is profiled if profile path is set
+    """
+    global runs
+    with runs_lock:
+        first = runs == 0
+        runs += 1
+        if first:
+            recorder.reset()
+    profile = cProfile.Profile() if first and recorder.profile_path else None
+    if profile is not None:
+        profile.enable()
+    try:
+        yield recorder
+    finally:
+        if profile is not None:
+            profile.disable()
+            Path(recorder.profile_path).parent.mkdir(parents=True, exist_ok=True)
+            profile.dump_stats(recorder.profile_path)
+            logging.info("profile is saved to %s", recorder.profile_path)
+        with runs_lock:
+            runs -= 1
+            last = runs == 0
+        if last:
+            recorder.write()
@@ -0,0 +1,173 @@
+"""
+This module provides offline dictionary built from Wiktionary dump
+
+Dump is JSONL extract made by wiktextract (https://kaikki.org),
+one entry per line. Entries are converted to responses
+of Free Dictionary API and stored compressed in SQLite index
+keyed by word, so they can be rendered the same way as online ones
+
+Run this module to build index or look word up:
+ python offline.py build kaikki.org-dictionary-English.jsonl
+ python offline.py lookup word
+"""
+import argparse
+import json
+import logging
+import sqlite3
+import zlib
+from pathlib import Path
+from threading import Lock
+
+from constants import *
+
+
+def convert_entry(entry):
+    """Convert wiktextract entry to meaning of Free Dictionary API response"""
+    definitions = []
+    for sense in entry.get("senses", []):
+        glosses = sense.get("glosses")
+        if not glosses:
+            continue
+        examples = [e["text"] for e in sense.get("examples", []) if e.get("text")]
+        definitions.append(
+            {
+                "definition": glosses[-1],  # the previous ones are parent senses
+                "example": examples[0] if examples else None,
+                "synonyms": [s["word"] for s in sense.get("synonyms", [])],
+                "antonyms": [s["word"] for s in sense.get("antonyms", [])],
+            }
+        )
+    return {
+        "partOfSpeech": entry.get("pos", ""),
+        "definitions": definitions,
+        "synonyms": [s["word"] for s in entry.get("synonyms", [])],
+    }
+
+
+def merge_entries(word, entries):
+    """Make Free Dictionary API response from all entries of word"""
+    phonetics = []
+    for entry in entries:
+        for sound in entry.get("sounds", []):
+            if sound.get("ipa") or sound.get("mp3_url"):
+                phonetics.append(
+                    {"text": sound.get("ipa", ""), "audio": sound.get("mp3_url", "")}
+                )
+    meanings = [convert_entry(entry) for entry in entries]
+    return [
+        {
+            "word": word,
+            "phonetic": next((p["text"] for p in phonetics if p["text"]), ""),
+            "phonetics": phonetics,
+            "meanings": [meaning for meaning in meanings if meaning["definitions"]],
+        }
+    ]
+
+
+def build_index(dump_path, index_path=OFFLINE_INDEX_PATH, lang_code="en"):
+    """Build index of words from wiktextract dump, return number of words
+
+    Entries are staged in temporary table first, because dump
+    isn't grouped by word. Words without definitions aren't indexed
+    """
+    Path(index_path).parent.mkdir(parents=True, exist_ok=True)
+    temp_path = Path(f"{index_path}.part")
+    temp_path.unlink(missing_ok=True)
+    connection = sqlite3.connect(temp_path)
+    connection.execute("PRAGMA journal_mode=OFF")
+    connection.execute("PRAGMA synchronous=OFF")
+    connection.execute("CREATE TEMP TABLE staging (word TEXT, entry TEXT)")
+    with open(dump_path, "r", encoding="utf-8") as file:
+        lines = (json.loads(line) for line in file if line.strip())
+        connection.executemany(
+            "INSERT INTO staging VALUES (?, ?)",
+            (
+                (entry["word"].casefold(), json.dumps(entry))
+                for entry in lines
+                if entry.get("word") and entry.get("lang_code", lang_code) == lang_code
+            ),
+        )
+    connection.execute(
+        "CREATE TABLE words (word TEXT PRIMARY KEY, response BLOB NOT NULL)"
+    )
+
+    def grouped():
+        rows = connection.execute(
+            "SELECT word, entry FROM staging ORDER BY word, rowid"
+        )
+        word, entries = None, []
+        for current, entry in rows:
+            if current != word and entries:
+                yield word, entries
+                entries = []
+            word = current
+            entries.append(json.loads(entry))
+        if entries:
+            yield word, entries
+
+    def responses():
+        for word, entries in grouped():
+            response = merge_entries(word, entries)
+            if response[0]["meanings"]:  # e.g. form-of entries without glosses
+                yield word, zlib.compress(json.dumps(response).encode())
+
+    connection.executemany("INSERT INTO words VALUES (?, ?)", responses())
+    connection.execute("DROP TABLE staging")
+    connection.commit()
+    count = connection.execute("SELECT COUNT(*) FROM words").fetchone()[0]
+    connection.execute("VACUUM")
+    connection.close()
+    temp_path.replace(index_path)
+    return count
+
+
+class OfflineDictionary:
+    """Read-only index built by build_index"""
+
+    def __init__(self, index_path=OFFLINE_INDEX_PATH):
+        if not Path(index_path).is_file():
+            raise FileNotFoundError(
+                f"offline index {index_path} not found, build it first"
+            )
+        self.connection = sqlite3.connect(
+            f"file:{Path(index_path).resolve().as_posix()}?mode=ro",
+            uri=True,
+            check_same_thread=False,
+        )
+        self.lock = Lock()
+
+    def lookup(self, word):
+        """Get response in format of Free Dictionary API or None"""
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT response FROM words WHERE word = ?", (word.casefold(),)
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(zlib.decompress(row[0]))
+
+    def close(self):
+        """Close index"""
+        self.connection.close()
+
+
+def main():
+    """Build offline index or look word up in it"""
+    parser = argparse.ArgumentParser(description="Manage offline dictionary")
+    parser.add_argument("--index", default=OFFLINE_INDEX_PATH)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build = subparsers.add_parser("build", help="build index from wiktextract dump")
+    build.add_argument("dump")
+    lookup = subparsers.add_parser("lookup", help="show entry of word")
+    lookup.add_argument("word")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s - %(message)s")
+    if args.command == "build":
+        logging.info("words indexed: %d", build_index(args.dump, args.index))
+    else:
+        print(json.dumps(OfflineDictionary(args.index).lookup(args.word), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,532 @@
+"""
+This module provides sources of dictionary entries
+
+Each provider returns response in format of Free Dictionary API,
+so notes are rendered the same way whatever source the word came from:
+ FreeDictionaryProvider requests Free Dictionary API,
+ CacheProvider reads cache of previous responses,
+ OfflineProvider reads index built by offline.py,
+ StubProvider makes up entries without any I/O (for tests and benchmarks)
+
+ProviderChain tries them in order, use make_chain to create one.
+HedgedProvider duplicates slow lookups of provider it wraps
+"""
+import asyncio
+import concurrent.futures
+import itertools
+import json
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+from threading import Lock
+
+import requests
+
+try:
+    import aiohttp
+except ImportError:  # only thread pool engine is available
+    aiohttp = None
+
+import metrics
+import offline
+import ratelimit
+from constants import *
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+rate_limiter = ratelimit.RateLimiter()  # shared by all dictionary requests
+
+
+class WordNotFoundError(LookupError):
+    """Dictionary has no entries for the word"""
+
+
+LOOKUP_ERRORS = (
+    WordNotFoundError,
+    KeyError,
+    IndexError,
+    TypeError,
+    ValueError,
+    requests.exceptions.RequestException,
+    asyncio.TimeoutError,
+) + ((aiohttp.ClientError,) if aiohttp is not None else ())
+
+
+class DictionaryProvider:
+    """Base class for sources of dictionary entries
+
+    lookup returns response, None if provider doesn't have the word
+    (next provider is asked then) or raises WordNotFoundError if word
+    doesn't exist at all. Remote providers give up at `deadline`
+    (time.monotonic) of thread pool engine, asyncio engine cancels lookups
+    """
+
+    name = "provider"
+    remote = False  # needs network
+
+    def lookup(self, word, deadline=None):
+        """Get response for word"""
+        raise NotImplementedError
+
+    async def lookup_async(self, session, word):
+        """Async version of lookup, local providers don't need session"""
+        return self.lookup(word)
+
+    def store(self, word, response):
+        """Keep response found by another provider, None if word doesn't exist"""
+
+    def close(self):
+        """Release resources of provider"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class FreeDictionaryProvider(DictionaryProvider):
+    """Free Dictionary API (https://dictionaryapi.dev)
+
+    Requests pass through shared rate limiter, throttled, failed with 5xx
+    or timed out requests are retried with backoff up to FETCH_RETRIES times
+    """
+
+    name = "api"
+    remote = True
+
+    def __init__(self, api_url=DICTIONARY_API_URL):
+        self.api_url = api_url
+
+    def lookup(self, word, deadline=None):
+        logging.info("parsing: %s", word)
+        for attempt in itertools.count():
+            rate_limiter.acquire()
+            started = time.perf_counter()
+            try:
+                response = requests.get(
+                    f"{self.api_url}{word}", timeout=time_left(word, deadline)
+                )
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                rate_limiter.throttled()
+                if attempt >= FETCH_RETRIES:
+                    raise
+                time.sleep(time_left(word, deadline, retry_delay(word, attempt)))
+                continue
+            if response.status_code in RETRY_STATUSES:
+                retry_after = ratelimit.retry_after(response.headers)
+                rate_limiter.throttled(retry_after)
+                if attempt < FETCH_RETRIES:
+                    delay = retry_delay(word, attempt, retry_after)
+                    time.sleep(time_left(word, deadline, delay))
+                    continue
+            else:
+                rate_limiter.success(time.perf_counter() - started)
+            if response.status_code == 404:
+                raise WordNotFoundError(word)
+            response.raise_for_status()
+            metrics.count("bytes fetched", len(response.content))
+            return response.json()
+
+    async def lookup_async(self, session, word):
+        """Uses given aiohttp session"""
+        logging.info("parsing: %s", word)
+        for attempt in itertools.count():
+            await rate_limiter.acquire_async()
+            started = time.perf_counter()
+            try:
+                async with session.get(f"{self.api_url}{word}") as response:
+                    if response.status in RETRY_STATUSES:
+                        retry_after = ratelimit.retry_after(response.headers)
+                        rate_limiter.throttled(retry_after)
+                        if attempt < FETCH_RETRIES:
+                            await asyncio.sleep(retry_delay(word, attempt, retry_after))
+                            continue
+                    else:
+                        rate_limiter.success(time.perf_counter() - started)
+                    if response.status == 404:
+                        raise WordNotFoundError(word)
+                    response.raise_for_status()
+                    body = await response.read()
+                    metrics.count("bytes fetched", len(body))
+                    return json.loads(body)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                rate_limiter.throttled()
+                if attempt >= FETCH_RETRIES:
+                    raise
+                await asyncio.sleep(retry_delay(word, attempt))
+
+
+class HedgedProvider(DictionaryProvider):
+    """Wrapper that duplicates slow lookups of another provider
+
+    If lookup is still pending after `percentile` of latencies of recent
+    lookups, the same lookup is started once more and the first response
+    wins, so a few hanging requests don't set the time of the whole import.
+    Nothing is hedged until `min_samples` latencies are known.
+    Thread pool engine runs `concurrency` lookups at once, executor has
+    room for each of them and its duplicate
+    """
+
+    def __init__(
+        self,
+        provider,
+        percentile=HEDGE_PERCENTILE,
+        window=HEDGE_WINDOW,
+        min_samples=20,
+        concurrency=CONCURRENCY,
+    ):
+        self.provider = provider
+        self.name = provider.name
+        self.remote = provider.remote
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.max_workers = 2 * concurrency
+        self.latencies = deque(maxlen=window)
+        self.hedged = 0
+        self.won = 0  # lookups won by duplicate
+        self.lock = Lock()
+        self.executor = None  # runs lookups of thread pool engine, created on demand
+
+    def threshold(self):
+        """Time after which lookup is hedged or None"""
+        with self.lock:
+            if len(self.latencies) < self.min_samples:
+                return None
+            latencies = sorted(self.latencies)
+        return latencies[
+            min(len(latencies) - 1, len(latencies) * self.percentile // 100)
+        ]
+
+    def _record(self, started, hedge_won=False):
+        with self.lock:
+            self.latencies.append(time.perf_counter() - started)
+            self.won += hedge_won
+
+    def _hedge(self, word, threshold):
+        with self.lock:
+            self.hedged += 1
+        logging.info("hedging %s after %.2fs", word, threshold)
+
+    @staticmethod
+    def _winner(done, pending):
+        """Completed lookup that has response, None if the others should be awaited
+
+        WordNotFoundError is response too, other errors are raised only
+        if there are no pending lookups
+        """
+        for future in done:
+            error = future.exception()
+            if error is None or isinstance(error, WordNotFoundError) or not pending:
+                return future
+        return None
+
+    def lookup(self, word, deadline=None):
+        threshold = self.threshold()
+        started = time.perf_counter()
+        if threshold is None:
+            try:
+                return self.provider.lookup(word, deadline)
+            finally:
+                self._record(started)
+        with self.lock:
+            if self.executor is None:
+                self.executor = concurrent.futures.ThreadPoolExecutor(self.max_workers)
+        first = self.executor.submit(self.provider.lookup, word, deadline)
+        pending = {first}
+        done, pending = concurrent.futures.wait(pending, timeout=threshold)
+        if pending:
+            self._hedge(word, threshold)
+            pending.add(self.executor.submit(self.provider.lookup, word, deadline))
+        while (winner := self._winner(done, pending)) is None:
+            done, pending = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+        for future in pending:
+            future.cancel()  # request in progress can't be stopped, result is ignored
+        self._record(started, winner is not first)
+        return winner.result()
+
+    async def lookup_async(self, session, word):
+        threshold = self.threshold()
+        started = time.perf_counter()
+        first = asyncio.ensure_future(self.provider.lookup_async(session, word))
+        pending = {first}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=threshold)
+            if pending:
+                self._hedge(word, threshold)
+                pending.add(
+                    asyncio.ensure_future(self.provider.lookup_async(session, word))
+                )
+            while (winner := self._winner(done, pending)) is None:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+        finally:
+            for task in pending:
+                task.cancel()
+        self._record(started, winner is not first)
+        return winner.result()
+
+    def store(self, word, response):
+        self.provider.store(word, response)
+
+    def close(self):
+        if self.hedged:
+            logging.info(
+                "%s: hedged lookups: %d, won by duplicate: %d",
+                self.name,
+                self.hedged,
+                self.won,
+            )
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+        self.provider.close()
+
+
+def time_left(word, deadline, limit=10):
+    """Seconds left for lookup of word till `deadline`, at most `limit`
+
+    Raise requests Timeout if deadline has passed
+    """
+    if deadline is None:
+        return limit
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise requests.exceptions.Timeout(f"deadline has passed: {word}")
+    return min(limit, left)
+
+
+def retry_delay(word, attempt, retry_after=None):
+    """Get delay before next attempt to fetch word and log it"""
+    delay = ratelimit.backoff(attempt, retry_after)
+    metrics.count("retries")
+    logging.info("retrying %s in %.1fs", word, delay)
+    return delay
+
+
+class CacheProvider(DictionaryProvider):
+    """Cache of responses (dict or cache_store.CacheBackend)
+
+    Value None means that word wasn't found by another provider
+    """
+
+    name = "cache"
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def lookup(self, word, deadline=None):
+        try:
+            response = self.cache[word]
+        except KeyError:  # also raised for expired entries
+            metrics.count("cache misses")
+            return None
+        metrics.count("cache hits")
+        if response is None:
+            raise WordNotFoundError(word)
+        return response
+
+    def store(self, word, response):
+        self.cache[word] = response
+
+
+class OfflineProvider(DictionaryProvider):
+    """Offline index built from Wiktionary dump, see offline.py"""
+
+    name = "offline"
+
+    def __init__(self, index_path=OFFLINE_INDEX_PATH):
+        self.dictionary = offline.OfflineDictionary(index_path)
+
+    def lookup(self, word, deadline=None):
+        return self.dictionary.lookup(word)
+
+    def close(self):
+        self.dictionary.close()
+
+
+def stub_response(word):
+    """Make up response of Free Dictionary API for word"""
+    return [
+        {
+            "word": word,
+            "phonetic": f"/{word}/",
+            "phonetics": [{"text": f"/{word}/", "audio": ""}],
+            "meanings": [
+                {
+                    "partOfSpeech": "noun",
+                    "definitions": [
+                        {
+                            "definition": f"Definition of {word}.",
+                            "example": f"An example with {word}.",
+                            "synonyms": [],
+                            "antonyms": [],
+                        }
+                    ],
+                    "synonyms": [],
+                }
+            ],
+        }
+    ]
+
+
+class StubProvider(DictionaryProvider):
+    """Provider that answers without any I/O
+
+    Words from `entries` get their responses, other words get made up
+    ones, or are missing if `make_up` isn't set
+    """
+
+    name = "stub"
+
+    def __init__(self, entries=None, make_up=True):
+        self.entries = entries or {}
+        self.make_up = make_up
+
+    def lookup(self, word, deadline=None):
+        if word in self.entries:
+            if self.entries[word] is None:
+                raise WordNotFoundError(word)
+            return self.entries[word]
+        return stub_response(word) if self.make_up else None
+
+
+@dataclass
+class ProviderStats:
+    """Lookups made by provider in chain"""
+
+    lookups: int = 0
+    hits: int = 0
+    not_found: int = 0
+    errors: int = 0
+    time: float = 0.0
+
+    @property
+    def hit_rate(self):
+        return self.hits / self.lookups if self.lookups else 0.0
+
+    @property
+    def latency(self):
+        """Mean time of lookup in seconds"""
+        return self.time / self.lookups if self.lookups else 0.0
+
+
+class ProviderChain(DictionaryProvider):
+    """Providers asked in order until one of them has the word
+
+    Response of provider that has the word (or knows that it doesn't
+    exist) is stored by providers before it, so it's cached for the next
+    time. Errors of provider don't stop the chain, the last one is raised
+    if nobody has the word
+    """
+
+    name = "chain"
+
+    def __init__(self, providers):
+        self.providers = list(providers)
+        self.stats = {provider.name: ProviderStats() for provider in self.providers}
+        self.lock = Lock()  # stats are updated by worker threads
+
+    def lookup(self, word, deadline=None):
+        error = None
+        for i, provider in enumerate(self.providers):
+            started = time.perf_counter()
+            try:
+                with metrics.stage(f"lookup {provider.name}"):
+                    response = provider.lookup(word, deadline)
+            except WordNotFoundError:
+                self._found(i, word, None, started)
+                raise
+            except LOOKUP_ERRORS as e:
+                self._count(provider, started, error=True)
+                error = e
+                continue
+            if response is not None:
+                self._found(i, word, response, started)
+                return response
+            self._count(provider, started)
+        raise error or WordNotFoundError(word)
+
+    async def lookup_async(self, session, word):
+        error = None
+        for i, provider in enumerate(self.providers):
+            started = time.perf_counter()
+            try:
+                with metrics.stage(f"lookup {provider.name}"):
+                    response = await provider.lookup_async(session, word)
+            except WordNotFoundError:
+                self._found(i, word, None, started)
+                raise
+            except LOOKUP_ERRORS as e:
+                self._count(provider, started, error=True)
+                error = e
+                continue
+            if response is not None:
+                self._found(i, word, response, started)
+                return response
+            self._count(provider, started)
+        raise error or WordNotFoundError(word)
+
+    def _count(self, provider, started, hit=False, not_found=False, error=False):
+        with self.lock:
+            stats = self.stats[provider.name]
+            stats.lookups += 1
+            stats.hits += hit
+            stats.not_found += not_found
+            stats.errors += error
+            stats.time += time.perf_counter() - started
+
+    def _found(self, index, word, response, started):
+        provider = self.providers[index]
+        self._count(
+            provider, started, hit=response is not None, not_found=response is None
+        )
+        for previous in self.providers[:index]:
+            previous.store(word, response)
+
+    def close(self):
+        for provider in self.providers:
+            provider.close()
+
+
+def make_chain(
+    names=DICTIONARY_PROVIDERS,
+    cache=None,
+    api_url=DICTIONARY_API_URL,
+    remote=True,
+    concurrency=CONCURRENCY,
+):
+    """Create ProviderChain of providers with given names
+
+    "cache" is used if cache is given and CACHE_ENABLED is set, "offline"
+    if its index is built (it's required if `remote` isn't set),
+    remote providers only if `remote` is set, their slow lookups are
+    hedged if HEDGE_ENABLED is set, `concurrency` lookups at once
+    """
+    providers = []
+    for name in names:
+        match name:
+            case "cache":
+                if CACHE_ENABLED and cache is not None:
+                    providers.append(CacheProvider(cache))
+            case "offline":
+                if not remote or Path(OFFLINE_INDEX_PATH).is_file():
+                    providers.append(OfflineProvider())
+            case "api":
+                if remote and HEDGE_ENABLED:
+                    providers.append(
+                        HedgedProvider(
+                            FreeDictionaryProvider(api_url), concurrency=concurrency
+                        )
+                    )
+                elif remote:
+                    providers.append(FreeDictionaryProvider(api_url))
+            case "stub":
+                providers.append(StubProvider())
+            case _:
+                raise ValueError(f"unknown dictionary provider: {name}")
+    return ProviderChain(providers)
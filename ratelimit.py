@@ -0,0 +1,148 @@
+"""
+This module provides adaptive rate limiter for requests to dictionary API
+and helpers to schedule retries of failed requests
+"""
+import asyncio
+import logging
+import random
+import time
+from email.utils import parsedate_to_datetime
+from threading import Lock
+
+from constants import *
+
+
+class RateLimiter:
+    """Token bucket shared by all fetch workers
+
+    Rate is adapted AIMD-style: it grows by `increase` after each
+    successful request and is multiplied by `decrease` when API answers
+    with 429 or latency spikes, requests are held while Retry-After lasts.
+    Works both with threads (acquire) and asyncio (acquire_async)
+    """
+
+    def __init__(
+        self,
+        rate=RATE_LIMIT,
+        min_rate=RATE_LIMIT_MIN,
+        max_rate=RATE_LIMIT_MAX,
+        increase=RATE_LIMIT_INCREASE,
+        decrease=RATE_LIMIT_DECREASE,
+        spike_factor=LATENCY_SPIKE_FACTOR,
+        min_spike=1.0,
+        log_interval=10,
+    ):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.spike_factor = spike_factor
+        self.min_spike = min_spike  # faster requests are never spikes
+        self.log_interval = log_interval
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.slowed_down = 0.0
+        self.latency = None  # moving average of successful requests
+        self.waiting = 0
+        self.logged = 0.0
+        self.lock = Lock()
+
+    def reserve(self):
+        """Take token, return time to wait before sending request"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(1.0, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            delay = max(-self.tokens / self.rate, self.blocked_until - now, 0.0)
+            if delay:
+                self.waiting += 1
+            self._log_status(now)
+            return delay
+
+    def _release(self):
+        with self.lock:
+            self.waiting -= 1
+
+    def acquire(self):
+        """Block current thread until request can be sent"""
+        delay = self.reserve()
+        if delay:
+            try:
+                time.sleep(delay)
+            finally:
+                self._release()
+
+    async def acquire_async(self):
+        """Wait until request can be sent"""
+        delay = self.reserve()
+        if delay:
+            try:
+                await asyncio.sleep(delay)
+            finally:
+                self._release()
+
+    def success(self, latency):
+        """Report successful request, slow down if its latency spiked"""
+        with self.lock:
+            if self.latency is not None and latency > max(
+                self.latency * self.spike_factor, self.min_spike
+            ):
+                self._slow_down(f"latency spike {latency:.1f}s")
+            else:
+                self.rate = min(self.max_rate, self.rate + self.increase)
+            if self.latency is None:
+                self.latency = latency
+            else:
+                self.latency = 0.9 * self.latency + 0.1 * latency
+
+    def throttled(self, retry_after=None):
+        """Report request rejected by API or failed because of timeout"""
+        with self.lock:
+            self._slow_down("request throttled")
+            if retry_after:
+                self.blocked_until = max(
+                    self.blocked_until, time.monotonic() + retry_after
+                )
+
+    def _slow_down(self, reason):
+        now = time.monotonic()
+        if now - self.slowed_down < max(self.latency or 0.0, 1.0):
+            return  # requests sent before previous slowdown are still coming back
+        self.slowed_down = now
+        self.rate = max(self.min_rate, self.rate * self.decrease)
+        self.tokens = min(self.tokens, 0.0)
+        logging.info(
+            "%s, rate: %.1f req/s, waiting: %d", reason, self.rate, self.waiting
+        )
+
+    def _log_status(self, now):
+        if now - self.logged >= self.log_interval:
+            self.logged = now
+            logging.info("rate: %.1f req/s, waiting: %d", self.rate, self.waiting)
+
+
+def retry_after(headers):
+    """Parse Retry-After header, return seconds or None"""
+    value = headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff(attempt, retry_after=None, base=RETRY_BACKOFF, cap=RETRY_BACKOFF_MAX):
+    """Delay before retry: exponential backoff with full jitter
+
+    Never less than Retry-After if server sent it
+    """
+    delay = random.uniform(0, min(cap, base * 2**attempt))
+    return max(delay, retry_after or 0.0)
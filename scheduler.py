@@ -0,0 +1,146 @@
+"""
+This module provides thread pool that maps function over any iterable
+one item at a time
+
+Idle workers take the next item from shared iterator as soon as they
+are done with the previous one, so slow items hold only their own worker
+instead of a whole batch. Items are taken lazily, so generators
+and files being read work as well as lists
+
+Run this module to compare it with mapping fixed batches:
+ python scheduler.py --items 500 --workers 16
+"""
+import argparse
+import itertools
+import queue
+import random
+import time
+from multiprocessing.dummy import Pool as ThreadPool
+from threading import Event, Lock, Semaphore, Thread
+
+from constants import *
+
+
+def imap(func, iterable, workers=CONCURRENCY, ordered=True, window=None):
+    """Apply func to each item of iterable in `workers` threads
+
+    Yield results in order of items if `ordered` is set, in order of
+    completion otherwise. At most `window` items (64 per worker by default)
+    are taken but not yielded yet, so memory doesn't grow when the first
+    item is slow. Exception raised by func stops the workers and is
+    reraised by consumer
+    """
+    window = window or workers * 64
+    items = enumerate(iterable)
+    lock = Lock()  # iterator is shared by workers
+    slots = Semaphore(window)
+    results = queue.SimpleQueue()
+    stop = Event()
+    finished = object()
+
+    def work():
+        try:
+            while True:
+                slots.acquire()
+                if stop.is_set():
+                    break
+                with lock:
+                    item = next(items, None)
+                if item is None:
+                    break
+                index, value = item
+                results.put((index, func(value)))
+        except BaseException as error:
+            results.put((None, error))
+        finally:
+            results.put(finished)
+
+    threads = [Thread(target=work, daemon=True) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    done = {}  # index -> result waiting for previous items
+    next_index = 0
+    running = len(threads)
+    try:
+        while running:
+            item = results.get()
+            if item is finished:
+                running -= 1
+                continue
+            index, result = item
+            if index is None:
+                raise result
+            if not ordered:
+                slots.release()
+                yield result
+                continue
+            done[index] = result
+            while next_index in done:
+                slots.release()
+                yield done.pop(next_index)
+                next_index += 1
+    finally:
+        stop.set()
+        for _ in threads:
+            slots.release()  # wake up workers waiting for slot
+        for thread in threads:
+            thread.join()
+
+
+def map_batches(func, iterable, workers=CONCURRENCY, size=5):
+    """Apply func to batches of `size` items with pool.map
+
+    Previous way of splitting work, kept to compare with imap
+    """
+    iterator = iter(iterable)
+    batches = iter(lambda: list(itertools.islice(iterator, size)), [])
+    with ThreadPool(workers) as pool:
+        results = pool.map(lambda batch: [func(item) for item in batch], batches)
+    return list(itertools.chain.from_iterable(results))
+
+
+def skewed_latencies(items, slow_share, slow_latency, latency, seed=0):
+    """Make latencies where `slow_share` of items are slow"""
+    rand = random.Random(seed)
+    return [
+        slow_latency if rand.random() < slow_share else rand.uniform(0, 2 * latency)
+        for _ in range(items)
+    ]
+
+
+def benchmark(latencies, workers):
+    """Return seconds taken by map_batches and imap to sleep given latencies"""
+    timings = {}
+    for name, run in (
+        ("batches of 5", lambda: map_batches(time.sleep, latencies, workers)),
+        ("per item", lambda: list(imap(time.sleep, latencies, workers))),
+    ):
+        started = time.perf_counter()
+        run()
+        timings[name] = time.perf_counter() - started
+    return timings
+
+
+def main():
+    """Compare imap with map_batches on skewed latencies"""
+    parser = argparse.ArgumentParser(description="Benchmark work scheduling")
+    parser.add_argument("--items", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=CONCURRENCY)
+    parser.add_argument("--latency", type=float, default=0.02, help="mean, seconds")
+    parser.add_argument("--slow-latency", type=float, default=1.0)
+    parser.add_argument("--slow-share", type=float, nargs="+", default=[0, 0.01, 0.05])
+    args = parser.parse_args()
+
+    print(f"{'slow share':>10} {'batches of 5':>13} {'per item':>9} {'ideal':>6}")
+    for share in args.slow_share:
+        latencies = skewed_latencies(args.items, share, args.slow_latency, args.latency)
+        timings = benchmark(latencies, args.workers)
+        best = max(max(latencies), sum(latencies) / args.workers)
+        print(
+            f"{share:>10.0%} {timings['batches of 5']:>12.2f}s "
+            f"{timings['per item']:>8.2f}s {best:>5.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+This module provides settings of the app
+
+Config is immutable, it's made of defaults from constants.py overridden
+by values saved in CONFIG_PATH (only values that differ from defaults
+are saved, with keys used by GUI). Config is loaded once and passed to
+functions that need it, a new one is loaded when the file changes
+"""
+import logging
+from dataclasses import dataclass, field, fields
+from pathlib import Path
+from types import MappingProxyType
+
+import yaml
+
+import cache_store
+from constants import *
+
+# key in CONFIG_PATH -> field of Config
+KEYS = {
+    "modelName": "model_name",
+    "deckName": "deck_name",
+    "cacheEnabled": "cache_enabled",
+    "cachePath": "cache_path",
+    "cacheMaxEntries": "cache_max_entries",
+    "cacheMaxSizeMb": "cache_max_size_mb",
+    "cacheTtlDays": "cache_ttl_days",
+    "cacheNegativeTtlDays": "cache_negative_ttl_days",
+    "dictionaries": "dictionaries",
+}
+
+# part of the app -> fields it's built from
+PARTS = {
+    "deck": {"deck_name"},
+    "model": {"model_name", "dictionaries"},
+    "cache": {
+        "cache_enabled",
+        "cache_path",
+        "cache_max_entries",
+        "cache_max_size_mb",
+        "cache_ttl_days",
+        "cache_negative_ttl_days",
+    },
+}
+
+
+@dataclass(frozen=True)
+class Config:
+    """Settings of the app"""
+
+    model_name: str = MODEL_NAME
+    deck_name: str = DECK_NAME
+    cache_enabled: bool = CACHE_ENABLED
+    cache_path: str = CACHED_WORDS_PATH
+    cache_max_entries: int = CACHE_MAX_ENTRIES
+    cache_max_size_mb: int = CACHE_MAX_SIZE_MB
+    cache_ttl_days: int = CACHE_TTL_DAYS
+    cache_negative_ttl_days: int = CACHE_NEGATIVE_TTL_DAYS
+    dictionaries: dict = field(default_factory=lambda: DICTIONARIES)  # name -> shown
+
+    def __post_init__(self):
+        # links missing in given dictionaries are taken from defaults
+        dictionaries = MappingProxyType(DICTIONARIES | dict(self.dictionaries))
+        object.__setattr__(self, "dictionaries", dictionaries)
+
+    @classmethod
+    def from_dict(cls, data):
+        """Create config from values saved with GUI keys
+
+        Raise ValueError if some value has wrong type
+        """
+        if data is not None and not isinstance(data, dict):
+            raise ValueError(f"config must be mapping, not {type(data).__name__}")
+        types = {f.name: f.type for f in fields(cls)}
+        values = {}
+        for key, value in (data or {}).items():
+            if key in KEYS:
+                values[KEYS[key]] = convert(key, value, types[KEYS[key]])
+            else:
+                logging.warning("unknown setting in %s: %s", CONFIG_PATH, key)
+        return cls(**values)
+
+    def changes(self):
+        """Values that differ from defaults, with GUI keys"""
+        default = Config()
+        data = {}
+        for key, name in KEYS.items():
+            value, default_value = getattr(self, name), getattr(default, name)
+            if name == "dictionaries":
+                value = {k: v for k, v in value.items() if default_value.get(k) != v}
+                if value:
+                    data[key] = value
+            elif value != default_value:
+                data[key] = value
+        return data
+
+    def cache_policy(self):
+        """Policy of cache of parsed words"""
+        return cache_store.CachePolicy(
+            self.cache_max_entries,
+            self.cache_max_size_mb,
+            self.cache_ttl_days,
+            self.cache_negative_ttl_days,
+        )
+
+    def changed_parts(self, other):
+        """Parts of the app (see PARTS) that differ in other config"""
+        changed = {
+            f.name
+            for f in fields(self)
+            if getattr(self, f.name) != getattr(other, f.name)
+        }
+        return {part for part, names in PARTS.items() if names & changed}
+
+
+def convert(key, value, kind):
+    """Check value of setting against type of its field
+
+    Numbers are accepted as names, e.g. `deckName: 2024`
+    """
+    if kind is str and isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    if kind is dict:
+        if not isinstance(value, dict) or not all(
+            isinstance(name, str) and isinstance(shown, bool)
+            for name, shown in value.items()
+        ):
+            raise ValueError(f"{key} must be mapping of names to true/false")
+        return value
+    if not isinstance(value, kind) or (kind is int and isinstance(value, bool)):
+        raise ValueError(f"{key} must be {kind.__name__}, not {type(value).__name__}")
+    if kind is int and value < 0:
+        raise ValueError(f"{key} must not be negative")
+    return value
+
+
+def load(path=CONFIG_PATH):
+    """Load config from file, defaults are used if there's no file
+
+    Raise ValueError if file is broken
+    """
+    if not Path(path).is_file():
+        return Config()
+    with open(path, "r") as file:
+        try:
+            data = yaml.safe_load(file)
+        except yaml.YAMLError as error:
+            raise ValueError(f"{path} is broken: {error}") from error
+    return Config.from_dict(data)
+
+
+def save(config, path=CONFIG_PATH):
+    """Save values that differ from defaults, remove file if there are none"""
+    changes = config.changes()
+    if not changes:
+        Path(path).unlink(missing_ok=True)
+        return
+    with open(path, "w") as file:
+        yaml.safe_dump(changes, file)
@@ -0,0 +1,128 @@
+"""
+This module provides templates of anki model
+
+Assets (styling.css, front.html, back.html) are read once, links to
+enabled dictionaries are added to back of card. Compiled template is
+kept by key that is hash of assets and enabled dictionaries. Hash of
+html assets and dictionaries is also written into back of card, so
+templates of model in Anki that were made from them are recognized
+"""
+import hashlib
+from dataclasses import dataclass
+from pathlib import Path
+from threading import Lock
+
+from constants import *
+
+ASSETS_PATH = Path(__file__).resolve().parent / "assets"
+
+LINKS = {
+    "Oxford": '<a href="https://www.oxfordlearnersdictionaries.com/definition/english/{{Word}}"><img src="https://fontslogo.com/wp-content/uploads/2017/10/Oxford-Dictionaries-Logo-Font.jpg"></a>\n',
+    "Cambridge": '<a href="https://dictionary.cambridge.org/dictionary/english/{{Word}}/"><img src="https://w7.pngwing.com/pngs/647/218/png-transparent-coat-of-arms-of-the-university-of-cambridge-university-of-oxford-ulverston-victoria-high-school-others-text-logo-symmetry.png"></a>\n',
+    "Macmillan": '<a href="https://www.macmillandictionary.com/dictionary/british/{{Word}}"><img src="https://pbs.twimg.com/profile_images/1225002102608494592/GRFg82nJ_400x400.jpg"></a>\n',
+    "Urban Dictionary": '<a href="https://www.urbandictionary.com/define.php?term={{Word}}"><img src="https://play-lh.googleusercontent.com/unQjigibyJQvru9rcCOX7UCqyByuf5-h_tLpA-9fYH93uqrRAnZ0J2IummiejMMhi5Ch"></a>\n',
+    "Cambridge (ru)": 'ru:<a href="https://dictionary.cambridge.org/dictionary/english-russian/{{Word}}/"><img src="https://w7.pngwing.com/pngs/647/218/png-transparent-coat-of-arms-of-the-university-of-cambridge-university-of-oxford-ulverston-victoria-high-school-others-text-logo-symmetry.png"></a></p>\n',
+}
+
+
+@dataclass(frozen=True)
+class Template:
+    """Compiled template of model"""
+
+    key: str  # hash of all assets and enabled dictionaries
+    cards_key: str  # same without styling, written into back of card
+    css: str
+    front: str
+    back: str
+
+
+class Compiler:
+    """Compiler of templates, assets are read on first use"""
+
+    def __init__(self, folder=ASSETS_PATH):
+        self.folder = Path(folder)
+        self.lock = Lock()
+        self.assets = None  # name -> text
+        self.templates = {}  # key -> Template
+
+    def _load(self):
+        self.assets = {
+            name: (self.folder / name).read_text(encoding="utf-8")
+            for name in ("styling.css", "front.html", "back.html")
+        }
+
+    def compile(self, links={}):
+        """Get template with links to dictionaries enabled in `links`
+
+        Dictionaries missing in `links` are taken from DICTIONARIES
+        """
+        enabled = [
+            name for name, value in (DICTIONARIES | dict(links)).items() if value
+        ]
+        with self.lock:
+            if self.assets is None:
+                self._load()
+            cards_key = _hash(
+                self.assets["front.html"], self.assets["back.html"], *enabled
+            )
+            key = _hash(cards_key, self.assets["styling.css"])
+            if key not in self.templates:
+                self.templates[key] = self._compile(key, cards_key, enabled)
+            return self.templates[key]
+
+    def _compile(self, key, cards_key, enabled):
+        back_html = self.assets["back.html"] + "<p>"
+        back_html += "".join(LINKS[name] for name in enabled if name in LINKS)
+        back_html += "</p>"
+        back_html += f"\n<!-- {_marker(cards_key)} -->"
+        css, front_html = self.assets["styling.css"], self.assets["front.html"]
+        return Template(key, cards_key, css, front_html, back_html)
+
+
+def _hash(*parts):
+    return hashlib.sha256("\0".join(parts).encode()).hexdigest()[:16]
+
+
+def _marker(key):
+    return f"lazy-english {key}"
+
+
+def model_params(model_name, template):
+    """Create params for createModel action"""
+    return {
+        "modelName": model_name,
+        "inOrderFields": ["Word", "Sound", "Meaning", "IPA"],
+        "isCloze": False,
+        "css": template.css,
+        "cardTemplates": [
+            {"Name": model_name, "Front": template.front, "Back": template.back}
+        ],
+    }
+
+
+def model_updates(model_name, template, live_templates, live_css):
+    """Get (action, params) pairs that bring model in Anki to template
+
+    Only changed parts are updated: card template made by model_params
+    (named after model) if it wasn't made from the template (its back
+    has no key of it), and styling. Card templates added in Anki
+    are left as they are
+    """
+    updates = []
+    live = live_templates.get(model_name)
+    if live is not None and _marker(template.cards_key) not in live["Back"]:
+        changed = {model_name: {"Front": template.front, "Back": template.back}}
+        model = {"name": model_name, "templates": changed}
+        updates.append(("updateModelTemplates", {"model": model}))
+    if live_css != template.css:
+        model = {"name": model_name, "css": template.css}
+        updates.append(("updateModelStyling", {"model": model}))
+    return updates
+
+
+compiler = Compiler()  # shared by all modules
+
+
+def compile_template(links={}):
+    """Compile template with shared compiler"""
+    return compiler.compile(links)